@@ -1,22 +1,36 @@
 import streamlit as st
 from datetime import datetime, timedelta
 from google_sheets import open_spreadsheet
+from storage import Refresher, open_store
+from inbox import Inbox
 from holidays import is_today_national_holiday, is_today_user_holiday
-from notifications import predict_risk
-from notifications import calculate_attendance
+from snapshot import get_snapshot
+from occurrences import occurrence_index
+from whatif import upcoming_lectures, what_if
 import random
 
-@st.cache_data(ttl=60)
-def get_records(_sheet, worksheet_name):
-    return _sheet.worksheet(worksheet_name).get_all_records()
-
 
 SPREADSHEET_ID = "1wGnF_bV3pNMx2l3BtwXEfKFdbs3ToYsgxqqgnKBAqgU"
 
+# ✅ One local store + Sheets replicator + refresher per server process
+@st.cache_resource(show_spinner=False)
+def get_store():
+    spreadsheet = open_spreadsheet(SPREADSHEET_ID)
+    store = open_store(spreadsheet)
+    # Sheet edits are picked up in the background, never on a render
+    Refresher(store, spreadsheet).start()
+    return store
+
+
+@st.cache_resource(show_spinner=False)
+def get_inbox():
+    return Inbox(get_store())
+
+
 st.set_page_config(page_title="AttendSmart", layout="centered")
 st.title("📚 AttendSmart")
 
-spreadsheet = open_spreadsheet(SPREADSHEET_ID)
+store = get_store()
 
 tab_login, tab_semester, tab_timetable, tab_holidays, tab_attendance, tab_insights, tab_notifications = st.tabs(
     [
@@ -39,16 +53,12 @@ with tab_login:
     email = st.text_input("Email")
 
     def get_or_create_user(name, email):
-        users_ws = spreadsheet.worksheet("Users")
-        users = get_records(spreadsheet, "Users")
-
+        user = store.users.first(email=email)
+        if user:
+            return user["user_id"]
 
-        for user in users:
-            if user["email"] == email:
-                return user["user_id"]
-
-        user_id = len(users) + 1
-        users_ws.append_row([
+        user_id = store.users.count() + 1
+        store.users.append([
             user_id,
             name,
             email,
@@ -72,16 +82,9 @@ with tab_semester:
 
     st.subheader("📅 Semester Setup")
 
-    ws = spreadsheet.worksheet("Semester")
-    rows = get_records(spreadsheet, "Semester")
-
-
     user_id = str(st.session_state["user_id"])
 
-    existing = next(
-        (r for r in rows if str(r["user_id"]) == user_id),
-        None
-    )
+    existing = store.semester.first(user_id=user_id)
 
     # Defaults
     default_start = (
@@ -103,14 +106,13 @@ with tab_semester:
 
     if st.button("💾 Save Semester"):
         if existing:
-            row_index = rows.index(existing) + 2
-            ws.update(f"B{row_index}:D{row_index}", [[
-                semester_start.strftime("%Y-%m-%d"),
-                semester_end.strftime("%Y-%m-%d"),
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ]])
+            store.semester.update(existing["_id"], {
+                "semester_start": semester_start.strftime("%Y-%m-%d"),
+                "semester_end": semester_end.strftime("%Y-%m-%d"),
+                "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            })
         else:
-            ws.append_row([
+            store.semester.append([
                 user_id,
                 semester_start.strftime("%Y-%m-%d"),
                 semester_end.strftime("%Y-%m-%d"),
@@ -145,8 +147,7 @@ with tab_holidays:
             if not title:
                 st.error("Please add a title")
             else:
-                ws = spreadsheet.worksheet("User_Holidays")
-                ws.append_row([
+                store.user_holidays.append([
                     st.session_state["user_id"],
                     start_date.strftime("%Y-%m-%d"),
                     end_date.strftime("%Y-%m-%d"),
@@ -157,18 +158,11 @@ with tab_holidays:
                 st.success("Holiday added 🎉")
 
         st.subheader("📋 Your Holidays")
-        ws = spreadsheet.worksheet("User_Holidays")
-        all_rows = get_records(spreadsheet, "User_Holidays")
-
         user_id = str(st.session_state["user_id"])
 
-        user_holidays = []
-        for idx, row in enumerate(all_rows, start=2):  # start=2 because row 1 = header
-            if str(row["user_id"]) == user_id:
-                row["_row"] = idx
-                user_holidays.append(row)
+        user_holidays = store.user_holidays.where(user_id=user_id)
 
-        st.table(user_holidays)
+        st.table([{k: v for k, v in h.items() if k != "_id"} for h in user_holidays])
 
         st.subheader("✏️ Edit Holiday")
 
@@ -206,12 +200,12 @@ with tab_holidays:
 
 
             if st.button("Update Holiday"):
-                ws.update(f"B{selected['_row']}:E{selected['_row']}", [[
-                    new_start.strftime("%Y-%m-%d"),
-                    new_end.strftime("%Y-%m-%d"),
-                    new_title,
-                    new_category
-                ]])
+                store.user_holidays.update(selected["_id"], {
+                    "start_date": new_start.strftime("%Y-%m-%d"),
+                    "end_date": new_end.strftime("%Y-%m-%d"),
+                    "title": new_title,
+                    "category": new_category
+                })
                 st.success("Holiday updated ✅")
                 st.rerun()
 
@@ -226,7 +220,7 @@ with tab_holidays:
             )
 
             if st.button("Delete Holiday"):
-                ws.delete_rows(del_item["_row"])
+                store.user_holidays.delete(del_item["_id"])
                 st.success("Holiday deleted 🗑️")
                 st.rerun()
 
@@ -240,12 +234,12 @@ with tab_timetable:
         user_id = str(st.session_state["user_id"])
         # Holiday block (TODAY)
         
-        national = is_today_national_holiday(spreadsheet)
+        national = is_today_national_holiday(store)
         if national:
             st.info(f"🎉 Today is a National Holiday: **{national}**")
             st.stop()
 
-        user_holiday = is_today_user_holiday(spreadsheet, st.session_state["user_id"])
+        user_holiday = is_today_user_holiday(store, st.session_state["user_id"])
         if user_holiday:
             st.info(f"🏖️ Today is your holiday: **{user_holiday}**")
             st.stop()
@@ -261,8 +255,7 @@ with tab_timetable:
         end_time = st.time_input("End Time")
 
         if st.button("Add Lecture"):
-            timetable_ws = spreadsheet.worksheet("Timetable")
-            timetable_ws.append_row([
+            store.timetable.append([
                 st.session_state["user_id"],
                 day,
                 subject,
@@ -272,17 +265,9 @@ with tab_timetable:
             st.success("Lecture added ✅")
 
         st.subheader("📋 Your Lectures")
-        timetable_ws = spreadsheet.worksheet("Timetable")
-        rows = get_records(spreadsheet, "Timetable")
-
+        user_lectures = store.timetable.where(user_id=user_id)
 
-        user_lectures = []
-        for idx, row in enumerate(rows, start=2):
-            if str(row["user_id"]) == user_id:
-                row["_row"] = idx
-                user_lectures.append(row)
-
-        st.table(user_lectures)
+        st.table([{k: v for k, v in l.items() if k != "_id"} for l in user_lectures])
 
         st.subheader("✏️ Edit Lecture")
 
@@ -320,12 +305,12 @@ with tab_timetable:
 
 
             if st.button("Update Lecture"):
-                timetable_ws.update(f"B{lec['_row']}:E{lec['_row']}", [[
-                    new_day,
-                    new_subject,
-                    new_start.strftime("%H:%M"),
-                    new_end.strftime("%H:%M")
-                ]])
+                store.timetable.update(lec["_id"], {
+                    "day": new_day,
+                    "subject": new_subject,
+                    "start_time": new_start.strftime("%H:%M"),
+                    "end_time": new_end.strftime("%H:%M")
+                })
                 st.success("Lecture updated ✅")
                 st.rerun()
 
@@ -340,7 +325,7 @@ with tab_timetable:
             )
 
             if st.button("Delete Lecture"):
-                timetable_ws.delete_rows(del_lec["_row"])
+                store.timetable.delete(del_lec["_id"])
                 st.success("Lecture deleted 🗑️")
                 st.rerun()
 
@@ -356,30 +341,18 @@ with tab_attendance:
         today_day = datetime.now().strftime("%A")
         user_id = str(st.session_state["user_id"])
 
-        timetable_ws = spreadsheet.worksheet("Timetable")
-        attendance_ws = spreadsheet.worksheet("Attendance")
-
-        lectures = get_records(spreadsheet, "Timetable")
-        attendance = get_records(spreadsheet, "Attendance")
-
-
         # Today's lectures
-        today_lectures = [
-            l for l in lectures
-            if str(l["user_id"]) == user_id and l["day"] == today_day
-        ]
+        today_lectures = store.timetable.where(user_id=user_id, day=today_day)
 
         if not today_lectures:
             st.info("No lectures scheduled for today 🎉")
         else:
             for lec in today_lectures:
-                already_marked = next(
-                    (a for a in attendance
-                     if str(a["user_id"]) == user_id
-                     and a["date"] == today
-                     and a["subject"] == lec["subject"]
-                     and a["start_time"] == lec["start_time"]),
-                    None
+                already_marked = store.attendance.first(
+                    user_id=user_id,
+                    date=today,
+                    subject=lec["subject"],
+                    start_time=lec["start_time"]
                 )
 
                 st.markdown(f"### 📘 {lec['subject']} ({lec['start_time']} – {lec['end_time']})")
@@ -391,7 +364,7 @@ with tab_attendance:
 
                     with col1:
                         if st.button("✅ Yes", key=f"yes_{lec['subject']}_{lec['start_time']}"):
-                            attendance_ws.append_row([
+                            store.attendance.append([
                                 user_id,
                                 today,
                                 today_day,
@@ -405,7 +378,7 @@ with tab_attendance:
 
                     with col2:
                         if st.button("❌ No", key=f"no_{lec['subject']}_{lec['start_time']}"):
-                            attendance_ws.append_row([
+                            store.attendance.append([
                                 user_id,
                                 today,
                                 today_day,
@@ -419,7 +392,7 @@ with tab_attendance:
 
                     with col3:
                         if st.button("🚫 Off", key=f"off_{lec['subject']}_{lec['start_time']}"):
-                            attendance_ws.append_row([
+                            store.attendance.append([
                                 user_id,
                                 today,
                                 today_day,
@@ -440,7 +413,10 @@ with tab_insights:
 
     user_id = st.session_state["user_id"]
 
-    stats = calculate_attendance(spreadsheet, user_id)
+    # One snapshot feeds every widget below; recomputed only after writes
+    snapshot = get_snapshot(store, user_id)
+
+    stats = snapshot.stats
     if stats["total"] == 0:
         st.info("📌 No attendance data available yet.")
         st.caption("Start marking lectures to see attendance insights and risk analysis.")
@@ -453,7 +429,7 @@ with tab_insights:
     )
 
 #-----Attendance Risk Level-----
-    risk = predict_risk(spreadsheet, user_id)
+    risk = snapshot.risk
 
     st.subheader("⚠️ Attendance Risk Level")
 
@@ -464,24 +440,29 @@ with tab_insights:
     else:
         st.error(f"🔴 {risk['risk']} — {risk['message']}")
 
-#-----Subject Wise Risk-----
-    st.subheader("📚 Subject-wise Risk")
+#-----End-of-Semester Forecast-----
+    forecast = snapshot.forecast
 
-    from collections import defaultdict
+    if forecast and forecast["future_lectures"]:
+        st.subheader("🎲 End-of-Semester Forecast")
 
-    attendance = get_records(spreadsheet, "Attendance")
+        bands = forecast["bands"]
+        chance = forecast["p_below"] * 100
+        col1, col2 = st.columns(2)
+        col1.metric("Expected final attendance", f"{forecast['expected_pct']}%")
+        col2.metric("Chance of ending below 75%", f"{chance:.0f}%")
 
-    subject_data = defaultdict(lambda: {"total": 0, "present": 0})
+        st.caption(
+            f"Based on your attendance so far by subject and weekday, over "
+            f"{forecast['simulations']} simulations of the {forecast['future_lectures']} "
+            f"lectures left: 90% of outcomes fall between {bands[5]}% and {bands[95]}% "
+            f"(middle half {bands[25]}% – {bands[75]}%)."
+        )
 
-    for a in attendance:
-        if str(a["user_id"]) != str(user_id):
-            continue
-        if a["status"] == "Off":
-            continue
+#-----Subject Wise Risk-----
+    st.subheader("📚 Subject-wise Risk")
 
-        subject_data[a["subject"]]["total"] += 1
-        if a["status"] == "Yes":
-            subject_data[a["subject"]]["present"] += 1
+    subject_data = snapshot.subjects
 
     for subject, data in subject_data.items():
 
@@ -502,33 +483,97 @@ with tab_insights:
 #-----Skip Calculator-----
     st.subheader("🧮 Skip Calculator")
 
-    def max_skippable(present, total, min_pct=75):
-        skips = 0
-        while True:
-            if (present / (total + skips)) * 100 < min_pct:
-                return skips - 1
-            skips += 1
+    plan = snapshot.budget
+    overall = plan["overall"]
+
+    if overall["skippable"] > 0:
+        st.info(f"📌 You can skip **{overall['skippable']}** more lectures and stay above 75%.")
+    elif overall["must_attend"] == 0:
+        st.warning("📌 You are exactly at the limit — don't skip any more lectures.")
+    elif overall["reachable"]:
+        st.warning(
+            f"📌 Attend the next **{overall['must_attend']}** lectures in a row to get back "
+            f"to 75% ({overall['future']} lectures left this semester)."
+        )
+    else:
+        st.error(
+            f"📌 75% can no longer be reached this semester — attending every remaining "
+            f"lecture gets you to {overall['best_pct']}%."
+        )
+
+    if plan["subjects"]:
+        st.table([
+            {
+                "Subject": subject,
+                "Attendance %": b["pct"],
+                "Can skip": b["skippable"],
+                "Must attend": b["must_attend"] if b["must_attend"] >= 0 else "—",
+                "Lectures left": b["future"],
+                "75% reachable": "✅" if b["reachable"] else "❌",
+            }
+            for subject, b in plan["subjects"].items()
+        ])
 
-    skips = max_skippable(stats["present"], stats["total"])
+#-----What-if Planner-----
+    st.subheader("🔮 What-if Planner")
 
-    st.info(f"📌 You can skip **{skips}** more lectures and stay above 75%.")
+    index = occurrence_index(store, user_id)
+    today = datetime.now().date()
+    upcoming = upcoming_lectures(index, today)
 
-#-----Attendance Trend-----
-    import pandas as pd
+    if not upcoming:
+        st.info("No lectures scheduled in the next four weeks.")
+    else:
+        upcoming_days = sorted({d for d, _, _ in upcoming})
+        skip_days = st.multiselect(
+            "Days you plan to miss",
+            upcoming_days,
+            format_func=lambda d: d.strftime("%a %d %b")
+        )
+        skip_lectures = st.multiselect(
+            "Single lectures you plan to miss",
+            [lec for lec in upcoming if lec[0] not in skip_days],
+            format_func=lambda lec: f"{lec[0].strftime('%a %d %b')} · {lec[1]} {lec[2]}"
+        )
+        as_leave = st.checkbox(
+            "Count them as leave (not counted), like a holiday in the Holidays tab"
+        )
 
-    df = pd.DataFrame(attendance)
-    df = df[df["user_id"] == user_id]
-    df["date"] = pd.to_datetime(df["date"])
-    df = df[df["status"] != "Off"]
+        if skip_days or skip_lectures:
+            result = what_if(index, today, skip_days, skip_lectures, leave=as_leave)
+            overall = result["overall"]
 
-    weekly = (
-        df.assign(week=df["date"].dt.to_period("W"))
-        .groupby("week")
-        .apply(lambda x: (x["status"] == "Yes").sum() / len(x) * 100)
-        .reset_index(name="pct")
-    )
+            col1, col2 = st.columns(2)
+            col1.metric(
+                f"Right after {result['after_date']}",
+                f"{overall['after']}%",
+                delta=f"{round(overall['after'] - overall['now'], 2)}%"
+            )
+            col2.metric(
+                "At semester end",
+                f"{overall['end']}%",
+                delta=f"{round(overall['end'] - overall['baseline_end'], 2)}% vs. skipping nothing"
+            )
+            st.caption(
+                f"Missing {result['skipped']} lectures, attending every other one."
+            )
 
-    weekly["week"] = weekly["week"].astype(str)
+            st.table([
+                {
+                    "Subject": subject,
+                    "Missed": f["skipped"],
+                    "Now %": f["now"],
+                    "After %": f["after"],
+                    "Semester end %": f["end"],
+                    "Stays above 75%": "✅" if f["end"] >= 75 else "❌",
+                }
+                for subject, f in result["subjects"].items()
+            ])
+
+#-----Attendance Trend-----
+    import pandas as pd
+
+    weekly = pd.DataFrame(snapshot.weekly, columns=["week", "pct"])
 
     st.subheader("📈 Attendance Trend")
     st.line_chart(weekly.set_index("week")["pct"])
@@ -538,15 +583,27 @@ with tab_notifications:
     if "user_id" not in st.session_state:
         st.warning("Please login first")
     else:
-        st.subheader("🔔 Notification Preferences")
+        inbox = get_inbox()
+        unread = inbox.unread_count(st.session_state["user_id"])
 
-        ws = spreadsheet.worksheet("Notification_Settings")
-        data = get_records(spreadsheet, "Notification_Settings")
+        st.subheader(f"📥 Inbox ({unread} unread)" if unread else "📥 Inbox")
+        messages = inbox.for_user(st.session_state["user_id"])
 
-        existing = next(
-            (r for r in data if str(r["user_id"]) == str(st.session_state["user_id"])),
-            None
-        )
+        if not messages:
+            st.info("No notifications yet")
+        for m in messages:
+            sent = datetime.fromtimestamp(m["created_at"]).strftime("%d %b %H:%M")
+            marker = "" if m["read"] else "🆕 "
+            with st.expander(f"{marker}{m['title']} · {sent}"):
+                st.text(m["body"])
+
+        if unread and st.button("Mark all as read"):
+            inbox.mark_read(st.session_state["user_id"])
+            st.rerun()
+
+        st.subheader("🔔 Notification Preferences")
+
+        existing = store.notification_settings.first(user_id=st.session_state["user_id"])
 
         telegram = st.checkbox(
             "Telegram Notifications",
@@ -571,6 +628,21 @@ with tab_notifications:
             value=(existing.get("email_id", "") if existing else ""),
             disabled=not email
         )
+
+        saved_digest = int(existing.get("digest_minutes") or 0) if existing else 0
+        digest = st.checkbox(
+            "Digest mode (combine reminders into one message)",
+            value=saved_digest > 0,
+            key="notif_digest"
+        )
+        digest_minutes = st.number_input(
+            "Digest window (minutes)",
+            min_value=5,
+            max_value=720,
+            value=saved_digest or 60,
+            step=5,
+            disabled=not digest
+        )
         # UX + data consistency fix
         if not email:
             email_id = ""
@@ -582,28 +654,26 @@ with tab_notifications:
                 email_id = ""
 
             if existing:
-                row_index = data.index(existing) + 2
-
-                ws.update(f"B{row_index}:H{row_index}", [[
-                    "yes" if telegram else "no",
-                    "yes" if email else "no",
-                    "yes" if in_app else "no",
-                    existing.get("telegram_chat_id", ""),
-                    existing.get("telegram_code", ""),
-                    email_id,
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                ]])
+                store.notification_settings.update(existing["_id"], {
+                    "telegram": "yes" if telegram else "no",
+                    "email": "yes" if email else "no",
+                    "in_app": "yes" if in_app else "no",
+                    "email_id": email_id,
+                    "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "digest_minutes": str(digest_minutes) if digest else "0"
+                })
 
             else:
-                ws.append_row([
-                    user_id,                              # A user_id
+                store.notification_settings.append([
+                    st.session_state["user_id"],          # A user_id
                     "yes" if telegram else "no",           # B telegram
                     "yes" if email else "no",              # C email
                     "yes" if in_app else "no",             # D in_app
                     "",                                    # E telegram_chat_id
                     st.session_state.get("telegram_code", ""),  # F telegram_code
                     email_id,                              # G email_id
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # H updated_at
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # H updated_at
+                    str(digest_minutes) if digest else "0"  # I digest_minutes
                 ])
 
             st.success("Notification preferences saved ✅")
@@ -616,22 +686,19 @@ with tab_notifications:
 
             if "telegram_code" not in st.session_state:
                 st.session_state["telegram_code"] = f"AS-{random.randint(1000,9999)}"
-                ws = spreadsheet.worksheet("Notification_Settings")
-                rows = ws.get_all_records()
-
-                existing = next(
-                    (r for r in rows if str(r["user_id"]) == str(st.session_state["user_id"])),
-                    None
+                existing = store.notification_settings.first(
+                    user_id=st.session_state["user_id"]
                 )
 
                 if existing and existing.get("telegram_chat_id"):
                     st.success("✅ Telegram already linked")
                 else:
                     if existing:
-                        row_index = rows.index(existing) + 2
-                        ws.update_cell(row_index, 6, st.session_state["telegram_code"])  # telegram_code
+                        store.notification_settings.update(existing["_id"], {
+                            "telegram_code": st.session_state["telegram_code"]
+                        })
                     else:
-                        ws.append_row([
+                        store.notification_settings.append([
                             st.session_state["user_id"],
                             "no",
                             "no",
@@ -639,7 +706,8 @@ with tab_notifications:
                             "",                                # telegram_chat_id
                             st.session_state["telegram_code"], # telegram_code
                             "",
-                            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            "0"                                # digest_minutes
                         ])
 
             st.info(
@@ -0,0 +1,55 @@
+import numpy as np
+
+NO_DATES = np.array([], dtype="datetime64[D]")
+
+
+# ---------- Helpers ----------
+
+def weekmask(weekday):
+    """2 (Wednesday) -> '0010000' (numpy busday weekmask)"""
+    if weekday is None or not 0 <= weekday <= 6:
+        return None
+    mask = ["0"] * 7
+    mask[weekday] = "1"
+    return "".join(mask)
+
+
+def to_day(d):
+    return np.datetime64(d, "D")
+
+
+def day_array(dates):
+    """Iterable of datetime.date / YYYY-MM-DD -> datetime64[D] array"""
+    return np.array(list(dates), dtype="datetime64[D]")
+
+
+# ---------- Occurrences ----------
+
+def lecture_dates(weekday, start, end, holidays=NO_DATES):
+    """Every date in [start, end] falling on `weekday`, minus holidays."""
+    mask = weekmask(weekday)
+    if mask is None or start > end:
+        return NO_DATES
+
+    first = np.busday_offset(to_day(start), 0, roll="forward", weekmask=mask)
+    dates = np.arange(first, to_day(end) + 1, 7)
+    if len(holidays):
+        dates = dates[~np.isin(dates, holidays)]
+    return dates
+
+
+def first_marks(marks):
+    """
+    Keep the first mark per (date, subject, start), like the old
+    `next(...)` scans did.
+    """
+    if len(marks) < 2:
+        return marks
+
+    key = (
+        (marks["day"].astype("i8") << 32)
+        | (marks["subject"].astype("i8") << 11)
+        | marks["start"].astype("i8")
+    )
+    _, first = np.unique(key, return_index=True)
+    return marks[np.sort(first)]
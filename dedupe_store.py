@@ -0,0 +1,97 @@
+import json
+import time
+
+DEFAULT_TTL = 2 * 24 * 3600     # reminders are keyed by date, two days is plenty
+EVICT_EVERY = 500               # claims between expired-row sweeps
+MAX_KEYS = 500000               # hard cap on stored keys
+IN_CHUNK = 500                  # keys per SELECT ... IN (...)
+
+
+class DedupeStore:
+    """
+    Persistent "already sent" set in the local SQLite store.
+
+    claim() is an atomic insert-if-absent (claim_many() for a batch), so it's safe with several
+    notifier processes and survives restarts. Keys expire after their TTL
+    and are swept periodically, keeping the table bounded.
+    """
+
+    def __init__(self, store, name="reminders"):
+        self.store = store
+        self.name = name
+        self._claims = 0
+        with store.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS Sent_Reminders ("
+                "key TEXT PRIMARY KEY, expires_at REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_Sent_Reminders_expires_at "
+                "ON Sent_Reminders (expires_at)"
+            )
+
+    def _key(self, key):
+        return json.dumps([self.name, key], default=str)
+
+    def claim(self, key, ttl=DEFAULT_TTL):
+        """Returns True if `key` was not already claimed (caller should send)."""
+        return bool(self.claim_many([key], ttl))
+
+    def claim_many(self, keys, ttl=DEFAULT_TTL):
+        """
+        claim() for a batch of keys in one transaction, so a tick's
+        reminders cost one write lock instead of one each.
+        Returns the set of keys newly claimed.
+        """
+        now = time.time()
+        stored = {self._key(key): key for key in keys}
+        names = list(stored)
+        live = set()
+        with self.store.transaction() as conn:
+            # The write lock is held, so nothing can claim between the two
+            for i in range(0, len(names), IN_CHUNK):
+                chunk = names[i:i + IN_CHUNK]
+                live.update(k for (k,) in conn.execute(
+                    "SELECT key FROM Sent_Reminders WHERE expires_at >= ? "
+                    f"AND key IN ({', '.join('?' for _ in chunk)})",
+                    [now] + chunk
+                ))
+            fresh = [k for k in names if k not in live]
+            # REPLACE takes over expired rows still waiting for evict()
+            conn.executemany(
+                "INSERT OR REPLACE INTO Sent_Reminders (key, expires_at) VALUES (?, ?)",
+                [(k, now + ttl) for k in fresh]
+            )
+
+        before = self._claims
+        self._claims += len(names)
+        if before // EVICT_EVERY != self._claims // EVICT_EVERY:
+            self.evict()
+        return {stored[k] for k in fresh}
+
+    def release(self, key):
+        """Forget a claim, e.g. when the send could not be attempted."""
+        self.release_many([key])
+
+    def release_many(self, keys):
+        with self.store.transaction() as conn:
+            conn.executemany(
+                "DELETE FROM Sent_Reminders WHERE key = ?", [[self._key(k)] for k in keys]
+            )
+
+    def __contains__(self, key):
+        rows = self.store.query(
+            "SELECT 1 FROM Sent_Reminders WHERE key = ? AND expires_at >= ?",
+            [self._key(key), time.time()]
+        )
+        return bool(rows)
+
+    def evict(self):
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM Sent_Reminders WHERE expires_at < ?", [time.time()])
+            conn.execute(
+                "DELETE FROM Sent_Reminders WHERE key IN ("
+                "SELECT key FROM Sent_Reminders ORDER BY expires_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                [MAX_KEYS]
+            )
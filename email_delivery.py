@@ -0,0 +1,131 @@
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+import metrics
+
+SMTP_HOST = os.getenv("SMTP_HOST", "")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 25))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_FROM = os.getenv("SMTP_FROM", "AttendSmart <no-reply@attendsmart.local>")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "no") == "yes"
+
+SMTP_TIMEOUT = 10
+SMTP_IDLE_SECONDS = 240         # servers commonly drop idle sessions after ~5 min
+MAX_BATCH = 100                 # messages per SMTP session before reconnecting
+
+
+class EmailDelivery:
+    """
+    Queues emails and sends them in batches over one reused SMTP session.
+
+    `send()` only queues; `flush()` delivers everything queued, reusing the
+    open connection across flushes (re-connecting when it's idle, dropped,
+    or after MAX_BATCH messages). Point SMTP_HOST/SMTP_PORT at any local
+    SMTP server to run without an outside service. `on_result` gets
+    {"to", "ok", "tag"} per message, with the `tag` given to send().
+    """
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER,
+                 password=SMTP_PASSWORD, sender=SMTP_FROM, starttls=SMTP_STARTTLS,
+                 on_result=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.sender = sender
+        self.starttls = starttls
+        self.on_result = on_result
+
+        self.queue = []
+        self._lock = threading.Lock()
+        self._conn = None
+        self._last_used = 0.0
+        self._sent_on_conn = 0
+
+    # ---------- Public API ----------
+
+    def send(self, to, subject, body, tag=None):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(body)
+        with self._lock:
+            self.queue.append((message, tag))
+
+    def flush(self):
+        """Deliver queued messages. Returns (sent, failed)."""
+        with self._lock:
+            batch, self.queue = self.queue, []
+        if not batch:
+            return 0, 0
+
+        sent = failed = 0
+        started = time.perf_counter()
+        for message, tag in batch:
+            ok = self._deliver(message)
+            if ok:
+                sent += 1
+            else:
+                failed += 1
+            if self.on_result:
+                self.on_result({"to": message["To"], "ok": ok, "tag": tag})
+
+        metrics.EMAIL_MESSAGES.inc(sent, outcome="ok")
+        metrics.EMAIL_MESSAGES.inc(failed, outcome="failed")
+        metrics.EMAIL_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        return sent, failed
+
+    def close(self):
+        self.flush()
+        self._disconnect()
+
+    # ---------- Connection ----------
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.starttls:
+            conn.starttls()
+        if self.user:
+            conn.login(self.user, self.password)
+        self._conn = conn
+        self._sent_on_conn = 0
+        return conn
+
+    def _disconnect(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is not None and (
+            time.monotonic() - self._last_used > SMTP_IDLE_SECONDS
+            or self._sent_on_conn >= MAX_BATCH
+        ):
+            self._disconnect()
+        return self._conn or self._connect()
+
+    def _deliver(self, message):
+        # One retry on a fresh connection covers sessions the server dropped
+        for attempt in (1, 2):
+            try:
+                self._connection().send_message(message)
+                self._sent_on_conn += 1
+                self._last_used = time.monotonic()
+                return True
+            except smtplib.SMTPRecipientsRefused as e:
+                metrics.log("email_refused", level="warning", to=message["To"], error=str(e))
+                return False
+            except (smtplib.SMTPException, OSError) as e:
+                self._disconnect()
+                if attempt == 2:
+                    metrics.log("email_failed", level="error", to=message["To"], error=repr(e))
+        return False
@@ -0,0 +1,95 @@
+import numpy as np
+
+from records import Status, subject_name
+
+# Monte Carlo end-of-semester forecast.
+#
+# Each timetable slot (subject, weekday) gets an attendance rate learned from
+# the user's own history: a subject rate and a weekday rate, each shrunk
+# towards the overall rate by PRIOR_WEIGHT lectures, combined as
+#   p(slot) = p(subject) · p(weekday) / p(overall)
+# Every simulation also draws the overall rate from its Beta posterior, so
+# users with little history get wider bands. A slot with n lectures left is
+# one binomial draw, so a run is a (simulations × slots) array, not a loop.
+
+SIMULATIONS = 5000
+PRIOR_WEIGHT = 4
+BANDS = (5, 25, 50, 75, 95)
+
+
+def slot_history(index, today):
+    """
+    Per (subject, weekday) slot of an occurrences.OccurrenceIndex: arrays of
+    subject, weekday, held, attended and left (lectures after today).
+    """
+    weekday = (index.day.astype("i8") + 3) % 7          # 1970-01-01 was a Thursday
+    held = index.held(today)
+    upcoming = index.upcoming(today)
+
+    relevant = held | upcoming
+    slots, inverse = np.unique(
+        index.subject[relevant] * 7 + weekday[relevant], return_inverse=True
+    )
+    n = len(slots)
+
+    def count(mask):
+        return np.bincount(inverse[mask[relevant]], minlength=n).astype(np.int64)
+
+    return (
+        slots // 7, slots % 7,
+        count(held), count(held & (index.status == Status.YES)), count(upcoming),
+    )
+
+
+def _shrunk_rates(keys, held, attended, overall):
+    """{key: rate} per distinct key, shrunk towards `overall`"""
+    rates = {}
+    for key in set(keys.tolist()):
+        mask = keys == key
+        rates[key] = (
+            (attended[mask].sum() + PRIOR_WEIGHT * overall)
+            / (held[mask].sum() + PRIOR_WEIGHT)
+        )
+    return rates
+
+
+def forecast_attendance(index, today, threshold=75, simulations=SIMULATIONS, seed=0):
+    """
+    Distribution of the final attendance % at semester end.
+    Returns None when nothing has been held yet (no history to learn from).
+    """
+    subject, weekday, held, attended, left = slot_history(index, today)
+    present = int(attended.sum())
+    total = int(held.sum())
+    future = int(left.sum())
+    if total == 0:
+        return None
+
+    overall = (present + 1) / (total + 2)
+    subject_rates = _shrunk_rates(subject, held, attended, overall)
+    weekday_rates = _shrunk_rates(weekday, held, attended, overall)
+    slot_rate = np.array([
+        subject_rates[s] * weekday_rates[w] / overall
+        for s, w in zip(subject.tolist(), weekday.tolist())
+    ])
+
+    rng = np.random.default_rng(seed)
+    scale = rng.beta(present + 1, total - present + 1, size=simulations) / overall
+    p = np.clip(slot_rate[None, :] * scale[:, None], 0, 1)
+    final = (
+        (present + rng.binomial(left[None, :], p).sum(axis=1)) * 100 / (total + future)
+    )
+
+    return {
+        "simulations": simulations,
+        "future_lectures": future,
+        "expected_pct": round(float(final.mean()), 2),
+        "p_below": round(float((final < threshold).mean()), 4),
+        "bands": {
+            q: round(float(v), 2) for q, v in zip(BANDS, np.percentile(final, BANDS))
+        },
+        "subject_rates": {
+            subject_name(s): round(float(r) * 100, 1) for s, r in subject_rates.items()
+        },
+        "weekday_rates": {w: round(float(r) * 100, 1) for w, r in weekday_rates.items()},
+    }
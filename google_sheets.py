@@ -1,6 +1,7 @@
 import gspread
 import streamlit as st
 from google.oauth2.service_account import Credentials
+from quota_client import QuotaClient
 
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
@@ -9,13 +10,14 @@ SCOPES = [
 
 
 # ✅ Cache Google Sheets client (VERY IMPORTANT)
+# Wrapped so every call respects the Sheets quota and retries 429/5xx
 @st.cache_resource(show_spinner=False)
 def get_gsheet_client():
     creds = Credentials.from_service_account_file(
         "attendsmart-482611-d4e53c2dabec.json",
         scopes=SCOPES
     )
-    return gspread.authorize(creds)
+    return QuotaClient(gspread.authorize(creds))
 
 
 # ✅ Cache spreadsheet open
@@ -40,8 +40,12 @@
 #     return None
 
 
+import threading
+from bisect import bisect_left, bisect_right
 from datetime import datetime, date
-from sheet_cache import load_user_holidays, load_national_holidays
+
+import metrics
+from records import parse_day
 
 IST_FORMAT = "%Y-%m-%d"
 
@@ -58,51 +62,145 @@ def today_date():
     return datetime.now().date()
 
 
-# ---------- NATIONAL HOLIDAYS ----------
+# ---------- COMPILED CALENDAR ----------
 
-def is_national_holiday(spreadsheet, check_date):
+class HolidayCalendar:
     """
-    check_date: datetime.date or YYYY-MM-DD
+    Holidays parsed once:
+    - national: frozenset of date ordinals (+ titles)
+    - per user: merged, sorted leave intervals as parallel start/end ordinal lists
+    Rows with unparsable dates are skipped (and logged) rather than failing
+    the whole calendar.
     """
-    check_date = normalize_date(check_date)
-
-    holidays = load_national_holidays(spreadsheet)
-
-    for h in holidays:
-        h_date = normalize_date(h["date"])
-        if h_date == check_date:
-            return h["title"]
-
-    return None
-
 
-def is_today_national_holiday(spreadsheet):
-    return is_national_holiday(spreadsheet, today_date())
+    def __init__(self, national_rows, user_rows):
+        self.national_titles = {}
+        for h in national_rows:
+            day = parse_day(h.get("date"))
+            if day is None:
+                metrics.log(
+                    "holiday_row_skipped", level="warning", table="National_Holidays", row=h
+                )
+                continue
+            self.national_titles[day] = h.get("title")
+        self.national = frozenset(self.national_titles)
+        self.national_sorted = sorted(self.national)
+
+        ranges = {}
+        for h in user_rows:
+            start = parse_day(h.get("start_date"))
+            end = parse_day(h.get("end_date"))
+            if start is None or end is None:
+                metrics.log(
+                    "holiday_row_skipped", level="warning", table="User_Holidays", row=h
+                )
+                continue
+            ranges.setdefault(str(h["user_id"]), []).append((start, end, h.get("title")))
+
+        self.leave = {}         # user_id -> raw (start, end, title) sorted by start
+        self.intervals = {}     # user_id -> (starts, ends), merged
+
+        for user_id, rows in ranges.items():
+            rows.sort()
+            self.leave[user_id] = rows
+
+            starts, ends = [], []
+            for s, e, _ in rows:
+                if starts and s <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], e)
+                else:
+                    starts.append(s)
+                    ends.append(e)
+            self.intervals[user_id] = (starts, ends)
+
+    def national_title(self, check_date):
+        return self.national_titles.get(normalize_date(check_date).toordinal())
+
+    def user_title(self, user_id, check_date):
+        day = normalize_date(check_date).toordinal()
+        if not self._on_leave(str(user_id), day):
+            return None
+        for s, e, title in self.leave[str(user_id)]:
+            if s <= day <= e:
+                return title
+
+    def _on_leave(self, user_id, day):
+        starts, ends = self.intervals.get(user_id, ((), ()))
+        i = bisect_right(starts, day) - 1
+        return i >= 0 and day <= ends[i]
+
+    def users_on_leave(self, check_date):
+        """Set of user_ids on leave on a date."""
+        day = normalize_date(check_date).toordinal()
+        return {u for u in self.intervals if self._on_leave(u, day)}
+
+    def holidays_between(self, user_id, start, end):
+        """Sorted dates in [start, end] that are national holidays or user leave."""
+        lo = normalize_date(start).toordinal()
+        hi = normalize_date(end).toordinal()
+        if lo > hi:
+            return []
+
+        days = set(self.national_sorted[
+            bisect_left(self.national_sorted, lo):bisect_right(self.national_sorted, hi)
+        ])
+
+        starts, ends = self.intervals.get(str(user_id), ((), ()))
+        i = max(bisect_right(starts, lo) - 1, 0)
+        while i < len(starts) and starts[i] <= hi:
+            days.update(range(max(starts[i], lo), min(ends[i], hi) + 1))
+            i += 1
+
+        return [date.fromordinal(d) for d in sorted(days)]
+
+
+_calendar_cache = {}
+_calendar_lock = threading.Lock()
+
+
+def get_holiday_calendar(store):
+    """Compiled calendar, rebuilt only when either holiday table changes."""
+    versions = (store.version("National_Holidays"), store.version("User_Holidays"))
+
+    with _calendar_lock:
+        cached = _calendar_cache.get(id(store))
+        if cached and cached[0] == versions:
+            return cached[1]
+
+    calendar = HolidayCalendar(
+        store.national_holidays.all(), store.user_holidays.all()
+    )
+
+    with _calendar_lock:
+        _calendar_cache[id(store)] = (versions, calendar)
+    return calendar
+
+
+def holidays_between(store, user_id, start, end):
+    return get_holiday_calendar(store).holidays_between(user_id, start, end)
 
 
-# ---------- USER HOLIDAYS ----------
+# ---------- NATIONAL HOLIDAYS ----------
 
-def is_user_holiday(spreadsheet, user_id, check_date):
+def is_national_holiday(store, check_date):
     """
     check_date: datetime.date or YYYY-MM-DD
     """
-    check_date = normalize_date(check_date)
+    return get_holiday_calendar(store).national_title(check_date)
 
-    holidays = load_user_holidays(spreadsheet)
 
-    for h in holidays:
-        if str(h["user_id"]) != str(user_id):
-            continue
+def is_today_national_holiday(store):
+    return is_national_holiday(store, today_date())
 
-        start = normalize_date(h["start_date"])
-        end = normalize_date(h["end_date"])
 
-        if start <= check_date <= end:
-            return h["title"]
-
-    return None
+# ---------- USER HOLIDAYS ----------
 
+def is_user_holiday(store, user_id, check_date):
+    """
+    check_date: datetime.date or YYYY-MM-DD
+    """
+    return get_holiday_calendar(store).user_title(user_id, check_date)
 
-def is_today_user_holiday(spreadsheet, user_id):
-    return is_user_holiday(spreadsheet, user_id, today_date())
 
+def is_today_user_holiday(store, user_id):
+    return is_user_holiday(store, user_id, today_date())
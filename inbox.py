@@ -0,0 +1,79 @@
+import time
+
+# In-app notifications. Local to the store (not replicated to Sheets); the
+# Streamlit app reads a user's latest rows through the (user_id, created_at)
+# index.
+
+INBOX_LIMIT = 20
+INBOX_RETENTION = 30 * 24 * 3600        # seconds read notifications are kept
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS Inbox ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, kind TEXT, "
+    "title TEXT, body TEXT, created_at REAL, read_at REAL)",
+
+    "CREATE INDEX IF NOT EXISTS idx_Inbox_user_id_created_at "
+    "ON Inbox (user_id, created_at)",
+]
+
+
+class Inbox:
+    def __init__(self, store):
+        self.store = store
+        with store.transaction() as conn:
+            for sql in SCHEMA:
+                conn.execute(sql)
+
+    def post(self, user_id, kind, title, body):
+        self.post_many([(user_id, kind, title, body)])
+
+    def post_many(self, items):
+        """items: iterable of (user_id, kind, title, body)"""
+        now = time.time()
+        rows = [(str(u), kind, title, body, now) for u, kind, title, body in items]
+        if not rows:
+            return
+        with self.store.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO Inbox (user_id, kind, title, body, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def for_user(self, user_id, limit=INBOX_LIMIT):
+        rows = self.store.query(
+            "SELECT id, kind, title, body, created_at, read_at FROM Inbox "
+            "WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+            [str(user_id), limit]
+        )
+        return [
+            {
+                "id": r[0],
+                "kind": r[1],
+                "title": r[2],
+                "body": r[3],
+                "created_at": r[4],
+                "read": r[5] is not None,
+            }
+            for r in rows
+        ]
+
+    def unread_count(self, user_id):
+        return self.store.query(
+            "SELECT COUNT(*) FROM Inbox WHERE user_id = ? AND read_at IS NULL",
+            [str(user_id)]
+        )[0][0]
+
+    def mark_read(self, user_id):
+        with self.store.transaction() as conn:
+            conn.execute(
+                "UPDATE Inbox SET read_at = ? WHERE user_id = ? AND read_at IS NULL",
+                [time.time(), str(user_id)]
+            )
+
+    def prune(self, retention=INBOX_RETENTION):
+        with self.store.transaction() as conn:
+            conn.execute(
+                "DELETE FROM Inbox WHERE read_at IS NOT NULL AND created_at < ?",
+                [time.time() - retention]
+            )
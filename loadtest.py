@@ -0,0 +1,505 @@
+"""
+Load harness for the notification service. Nothing leaves the machine:
+
+- a synthetic institution (users, timetables, leave, attendance history)
+- an in-memory fake of the gspread Spreadsheet / Worksheet calls we use
+- a local fake Telegram Bot API endpoint
+- a simulated clock driving the notifier worker (notifications.build_worker)
+  through one day, with students marking attendance as lectures end
+
+Each size runs in a fresh process (clean memory numbers, own SQLite file):
+
+    python loadtest.py --users 1000 10000 100000
+"""
+
+import argparse
+import collections
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUBJECTS = [
+    "Mathematics", "Physics", "Chemistry", "Biology", "English", "History",
+    "Economics", "Computer Science", "Statistics", "Philosophy",
+]
+SLOTS = [("09:00", "10:00"), ("10:00", "11:00"), ("11:15", "12:15"),
+         ("13:00", "14:00"), ("14:00", "15:00"), ("15:15", "16:15")]
+MARK_WINDOW_MINUTES = 10       # students mark within this long after a lecture ends
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+# ================== SYNTHETIC INSTITUTION ==================
+
+def generate(users, day, lectures_per_day=4, history_days=2, leave_rate=0.02,
+             digest_rate=0.1, seed=1):
+    """
+    Worksheet name -> rows (header first). Timetables share a handful of
+    slot times, so reminders bunch up at the same minutes as in a real
+    institution.
+    """
+    from storage import TABLES
+
+    rng = random.Random(seed)
+    stamp = f"{day} 08:00:00"
+    sheets = {name: [list(columns)] for name, columns in TABLES.items()}
+    semester_start = day - timedelta(days=60)
+    semester_end = day + timedelta(days=60)
+
+    sheets["National_Holidays"].append([str(day + timedelta(days=30)), "Synthetic Holiday"])
+
+    for uid in range(1, users + 1):
+        sheets["Users"].append([uid, f"Student {uid}", f"student{uid}@example.edu", stamp])
+        sheets["Semester"].append([uid, str(semester_start), str(semester_end), stamp])
+
+        lectures = []
+        for weekday in DAYS[:6]:
+            for start, end in rng.sample(SLOTS, lectures_per_day):
+                lecture = [uid, weekday, rng.choice(SUBJECTS), start, end]
+                lectures.append(lecture)
+                sheets["Timetable"].append(lecture)
+
+        if rng.random() < leave_rate:
+            leave_start = day - timedelta(days=rng.randint(0, 3))
+            sheets["User_Holidays"].append([
+                uid, str(leave_start), str(leave_start + timedelta(days=rng.randint(0, 4))),
+                "Leave", "Personal", stamp
+            ])
+
+        # Today's marks arrive during the simulated day (see Marker)
+        for back in range(history_days, 0, -1):
+            d = day - timedelta(days=back)
+            for _, weekday, subject, start, end in lectures:
+                if weekday != DAYS[d.weekday()]:
+                    continue
+                status = rng.choices(["Yes", "No", "Off"], [80, 15, 5])[0]
+                sheets["Attendance"].append(
+                    [uid, str(d), weekday, subject, start, end, status, stamp]
+                )
+
+        sheets["Notification_Settings"].append([
+            uid, "yes", "no", "no", str(uid), "", "", stamp,
+            "30" if rng.random() < digest_rate else "0",
+        ])
+
+    return sheets
+
+
+# ================== FAKE GSPREAD ==================
+
+class FakeRecords:
+    """get_all_records() result that builds dicts lazily (sizes reach millions)."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows) - 1
+
+    def __iter__(self):
+        header = self.rows[0]
+        for row in self.rows[1:]:
+            yield dict(zip(header, row))
+
+
+class FakeWorksheet:
+    def __init__(self, title, rows):
+        self.title = title
+        self.rows = rows
+        self.calls = {}
+
+    def _count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    @staticmethod
+    def _column_number(a1):
+        number = 0
+        for letter in re.match(r"([A-Z]+)", a1).group(1):
+            number = number * 26 + ord(letter) - 64
+        return number
+
+    @staticmethod
+    def _row_number(a1):
+        return int(re.match(r"[A-Z]+(\d+)", a1).group(1))
+
+    def get_all_records(self):
+        self._count("get_all_records")
+        return FakeRecords(self.rows)
+
+    def get_all_values(self):
+        self._count("get_all_values")
+        return [list(r) for r in self.rows]
+
+    def get(self, range_name):
+        self._count("get")
+        start = self._row_number(range_name.split(":")[0])
+        return [[str(v) for v in r] for r in self.rows[start - 1:]]
+
+    def row_values(self, row):
+        self._count("row_values")
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values])
+
+    def append_rows(self, values, **kwargs):
+        self._count("append_rows")
+        self.rows.extend(list(v) for v in values)
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self._count("update")
+        start = self._row_number(range_name)
+        column = self._column_number(range_name)
+        for i, row in enumerate(values):
+            current = list(self.rows[start + i - 1]) if start + i <= len(self.rows) else []
+            current += [""] * (column - 1 - len(current))
+            tail = current[column - 1 + len(row):]
+            self._put(start + i, current[:column - 1] + list(row) + tail)
+
+    def batch_update(self, data, **kwargs):
+        self._count("batch_update")
+        for item in data:
+            self._put(self._row_number(item["range"]), item["values"][0])
+
+    def delete_rows(self, start, end=None):
+        self._count("delete_rows")
+        del self.rows[start - 1:(end or start)]
+
+    def _put(self, row, values):
+        while len(self.rows) < row:
+            self.rows.append([])
+        self.rows[row - 1] = list(values)
+
+
+class FakeSpreadsheet:
+    def __init__(self, sheets, spreadsheet_id="loadtest"):
+        self.id = spreadsheet_id
+        self._worksheets = {name: FakeWorksheet(name, rows) for name, rows in sheets.items()}
+
+    def worksheet(self, title):
+        return self._worksheets[title]
+
+    def worksheets(self):
+        return list(self._worksheets.values())
+
+    def calls(self):
+        return {name: ws.calls for name, ws in self._worksheets.items() if ws.calls}
+
+
+# ================== FAKE TELEGRAM ==================
+
+class FakeTelegram:
+    """Local Bot API stand-in; answers sendMessage, optionally with 429s."""
+
+    def __init__(self, error_rate=0.0, seed=1):
+        self.received = 0
+        self.rejected = 0
+        self.chats = set()
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake._lock:
+                    throttled = fake._rng.random() < error_rate
+                    if throttled:
+                        fake.rejected += 1
+                    else:
+                        fake.received += 1
+                        fake.chats.add(payload["chat_id"])
+                if throttled:
+                    self._reply(429, {"ok": False, "parameters": {"retry_after": 0}})
+                else:
+                    self._reply(200, {"ok": True, "result": {"message_id": fake.received}})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+# ================== STUDENTS ==================
+
+class Marker:
+    """
+    Marks a share of today's lectures through store.attendance, as the app
+    does, within MARK_WINDOW_MINUTES of each one ending (some before the
+    reminder, some after), so reminders see fresh Attendance rows and the
+    incremental reparse paths run.
+    """
+
+    def __init__(self, store, timetable, day, marked_rate=0.6, seed=1):
+        rng = random.Random(seed)
+        weekday = DAYS[day.weekday()]
+        midnight = datetime.combine(day, datetime.min.time())
+        self.store = store
+        self.stamp = f"{day} 08:00:00"
+        self.pending = collections.deque(sorted(
+            (
+                midnight + timedelta(
+                    hours=int(end[:2]), minutes=int(end[3:]),
+                    seconds=rng.randrange(MARK_WINDOW_MINUTES * 60),
+                ),
+                [uid, str(day), weekday, subject, start, end],
+            )
+            for uid, lecture_day, subject, start, end in timetable[1:]
+            if lecture_day == weekday and rng.random() < marked_rate
+        ))
+        self._rng = rng
+        self.marked = 0
+
+    def until(self, now):
+        """Write every mark made by `now`."""
+        while self.pending and self.pending[0][0] <= now:
+            _, row = self.pending.popleft()
+            status = self._rng.choices(["Yes", "No", "Off"], [80, 15, 5])[0]
+            self.store.attendance.append(row + [status, self.stamp])
+            self.marked += 1
+
+
+# ================== CLOCK ==================
+
+class SimClock:
+    """Callable clock for ReminderScheduler; sleep() advances simulated time."""
+
+    def __init__(self, start):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += timedelta(seconds=max(seconds, 1))
+
+
+# ================== ONE RUN ==================
+
+def rss_mb():
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_one(args):
+    """Runs in a child process; environment is set before app modules import."""
+    workdir = tempfile.mkdtemp(prefix="attendsmart-load-")
+    telegram_fake = FakeTelegram(args.error_rate)
+    os.environ.update({
+        "ATTENDSMART_DB": os.path.join(workdir, "load.db"),
+        "TELEGRAM_BOT_TOKEN": "loadtest",
+        "TELEGRAM_API_URL": telegram_fake.url,
+        "METRICS_PORT": "0",
+        "SMTP_HOST": "",
+    })
+
+    day = datetime.strptime(args.date, "%Y-%m-%d").date()
+
+    started = time.perf_counter()
+    sheets = generate(
+        args.users, day, args.lectures_per_day, args.history_days,
+        args.leave_rate, args.digest_rate, args.seed,
+    )
+    spreadsheet = FakeSpreadsheet(sheets)
+    generate_s = time.perf_counter() - started
+
+    # notifications opens the spreadsheet at import; hand it the fake instead
+    fake_sheets = types.ModuleType("google_sheets")
+    fake_sheets.open_spreadsheet = lambda spreadsheet_id: spreadsheet
+    sys.modules["google_sheets"] = fake_sheets
+
+    started = time.perf_counter()
+    import notifications
+    from sharding import ShardLeases
+    from storage import Refresher
+    from telegram_delivery import TelegramDelivery
+    bootstrap_s = time.perf_counter() - started
+
+    notifications._telegram = TelegramDelivery(
+        "loadtest", base_url=telegram_fake.url, global_rate=args.telegram_rate,
+        on_result=notifications.record_failure("telegram"),
+    )
+    store = notifications.store
+
+    clock = SimClock(datetime.combine(day, datetime.min.time()))
+    end = clock.now + timedelta(days=1)
+    marker = Marker(store, sheets["Timetable"], day, args.marked_rate, args.seed)
+    ticks = []
+    fired_ticks = []
+    delivery_s = 0.0
+
+    # The same scheduler, upkeep and sheet refresher as notifications.run(),
+    # on simulated time (the refresher keeps real time)
+    shards = ShardLeases(store, owner="loadtest")
+    scheduler, before_tick = notifications.build_worker(
+        store, shards, clock=clock, sleep=clock.sleep
+    )
+    refresher = Refresher(store, spreadsheet)
+    refresher.start()
+
+    while clock.now < end:
+        marker.until(clock.now)
+
+        tick_started = time.perf_counter()
+        before_tick()
+        fired = scheduler.run_pending(clock.now)
+        tick_s = time.perf_counter() - tick_started
+
+        ticks.append(tick_s)
+        if fired:
+            fired_ticks.append(tick_s)
+            delivery_started = time.perf_counter()
+            notifications._telegram.flush()
+            delivery_s += time.perf_counter() - delivery_started
+
+        clock.sleep(scheduler.seconds_until_next(clock.now))
+
+    refresher.stop()
+    shards.release()
+
+    notifications._telegram.close()
+    telegram_fake.close()
+
+    results = list(notifications._telegram.results)
+    latencies = [r["latency"] for r in results if r["ok"]]
+    busy_s = sum(ticks) + delivery_s
+
+    return {
+        "users": args.users,
+        "rows": {name: len(rows) - 1 for name, rows in sheets.items()},
+        "generate_s": round(generate_s, 2),
+        "bootstrap_s": round(bootstrap_s, 2),
+        "ticks": len(ticks),
+        "tick_ms_p50": round(percentile(ticks, 50) * 1000, 1),
+        "tick_ms_p95": round(percentile(ticks, 95) * 1000, 1),
+        "tick_ms_max": round(max(ticks, default=0) * 1000, 1),
+        "fired_ticks": len(fired_ticks),
+        "fired_tick_ms_p95": round(percentile(fired_ticks, 95) * 1000, 1),
+        "marks": marker.marked,
+        "messages": telegram_fake.received,
+        "throttled": telegram_fake.rejected,
+        "messages_per_s": round(telegram_fake.received / busy_s, 1) if busy_s else 0.0,
+        "telegram_ms_p95": round(percentile(latencies, 95) * 1000, 1),
+        "peak_rss_mb": rss_mb(),
+        "sheets_calls": spreadsheet.calls(),
+    }
+
+
+# ================== CLI ==================
+
+COLUMNS = [
+    ("users", "users"), ("ticks", "ticks"), ("tick_ms_p50", "tick p50 ms"),
+    ("tick_ms_p95", "tick p95 ms"), ("tick_ms_max", "tick max ms"),
+    ("fired_tick_ms_p95", "fired p95 ms"),
+    ("messages", "messages"), ("messages_per_s", "msg/s"),
+    ("peak_rss_mb", "peak RSS MB"), ("bootstrap_s", "bootstrap s"),
+]
+
+
+def print_table(reports):
+    widths = [max(len(title), *(len(str(r[key])) for r in reports)) for key, title in COLUMNS]
+    print("  ".join(title.rjust(w) for (_, title), w in zip(COLUMNS, widths)))
+    for r in reports:
+        print("  ".join(str(r[key]).rjust(w) for (key, _), w in zip(COLUMNS, widths)))
+
+
+def next_weekday(day):
+    """`day`, or the Monday after it on a weekend (a day with lectures)."""
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--date", default=str(next_weekday(date.today())),
+                        help="simulated day, YYYY-MM-DD (default: next weekday)")
+    parser.add_argument("--lectures-per-day", type=int, default=4)
+    parser.add_argument("--history-days", type=int, default=2)
+    parser.add_argument("--leave-rate", type=float, default=0.02)
+    parser.add_argument("--marked-rate", type=float, default=0.6,
+                        help="share of today's lectures marked as they end")
+    parser.add_argument("--digest-rate", type=float, default=0.1,
+                        help="share of users in digest mode")
+    parser.add_argument("--telegram-rate", type=float, default=1000,
+                        help="global msgs/s cap (Telegram's real limit is ~30)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of fake Telegram requests answered with 429")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print raw reports")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.child:
+        args.users = args.users[0]
+        print(json.dumps(run_one(args)))
+        return
+
+    reports = []
+    passthrough = [a for a in (argv or sys.argv[1:]) if a != "--json"]
+    for users in args.users:
+        cmd = [sys.executable, os.path.abspath(__file__), "--child"]
+        cmd += strip_users(passthrough) + ["--users", str(users)]
+        print(f"… simulating {users} users", file=sys.stderr)
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        reports.append(json.loads(out.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print_table(reports)
+
+
+def strip_users(argv):
+    """Drop `--users N [N ...]` from argv so each child gets one size."""
+    out, skipping = [], False
+    for a in argv:
+        if a == "--users":
+            skipping = True
+            continue
+        if skipping and not a.startswith("--"):
+            continue
+        skipping = False
+        out.append(a)
+    return out
+
+
+if __name__ == "__main__":
+    main()
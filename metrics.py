@@ -0,0 +1,214 @@
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process counters, gauges and histograms, served as Prometheus text on
+# /metrics, plus one-line JSON event logs. No client library needed.
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))      # 0 disables the endpoint
+
+# Each process on the host serves METRICS_PORT + its offset
+BOT_PORT_OFFSET = 0
+NOTIFIER_PORT_OFFSET = 1                                # + the worker's index
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            # One slot per bucket plus a final overflow slot (+Inf only)
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self.values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                labels = _label_text(self.labels, key, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+def render():
+    with _lock:
+        metrics = list(_registry)
+    lines = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ================== METRICS ==================
+
+TICK_SECONDS = Histogram(
+    "attendsmart_tick_seconds", "Scheduler tick duration"
+)
+LAST_TICK = Gauge(
+    "attendsmart_last_tick_timestamp", "Unix time of the last completed scheduler tick"
+)
+SCHEDULER_ERRORS = Counter(
+    "attendsmart_scheduler_errors_total", "Scheduler ticks that raised"
+)
+EVENTS_FIRED = Counter(
+    "attendsmart_scheduler_events_total", "Scheduler events fired", ["kind"]
+)
+
+SHEET_FETCH_SECONDS = Histogram(
+    "attendsmart_sheet_fetch_seconds", "Worksheet fetch latency", ["worksheet", "mode"]
+)
+SHEET_ROWS = Gauge(
+    "attendsmart_sheet_rows", "Rows fetched in the last worksheet pull", ["worksheet", "mode"]
+)
+SHEETS_REQUESTS = Counter(
+    "attendsmart_sheets_requests_total",
+    "Sheets API client events (calls, throttled, retried, quota_errors, failed, coalesced)",
+    ["event"]
+)
+
+REMINDERS = Counter(
+    "attendsmart_reminders_total", "Reminders by outcome (planned, queued, sent, deduped, failed)",
+    ["kind", "channel", "outcome"]
+)
+TELEGRAM_SECONDS = Histogram(
+    "attendsmart_telegram_seconds", "Telegram delivery latency incl. retries", ["outcome"]
+)
+TELEGRAM_MESSAGES = Counter(
+    "attendsmart_telegram_messages_total", "Telegram messages by outcome", ["outcome", "status"]
+)
+EMAIL_MESSAGES = Counter(
+    "attendsmart_email_messages_total", "Emails by outcome", ["outcome"]
+)
+EMAIL_FLUSH_SECONDS = Histogram(
+    "attendsmart_email_flush_seconds", "Time to deliver one batch of queued emails"
+)
+
+BOT_COMMANDS = Counter(
+    "attendsmart_bot_commands_total", "Telegram bot commands handled", ["command", "outcome"]
+)
+
+
+# ================== JSON LOGS ==================
+
+def log(event, level="info", **fields):
+    record = {"ts": round(time.time(), 3), "level": level, "event": event}
+    record.update(fields)
+    print(json.dumps(record, default=str), file=sys.stderr, flush=True)
+
+
+# ================== HTTP ENDPOINT ==================
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(offset=0, port=METRICS_PORT, host="0.0.0.0"):
+    """Serve /metrics from a daemon thread. Returns the server, or None if disabled."""
+    if not port:
+        return None
+    port += offset
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        log("metrics_unavailable", level="warning", port=port, error=str(e))
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    log("metrics_serving", port=server.server_address[1])
+    return server
@@ -1,11 +1,27 @@
+import atexit
 import os
 import time
-import requests
-from datetime import datetime, timedelta
+from collections import Counter
+from datetime import datetime
 from dotenv import load_dotenv
 
+import metrics
+
 from google_sheets import open_spreadsheet
-from holidays import is_national_holiday, is_today_user_holiday, is_user_holiday
+from storage import Refresher, open_store
+from snapshot import get_snapshot
+from records import typed
+from planner import (
+    combined_message, drop_marked, plan_attendance, plan_digest, recipients, unmarked_today
+)
+from scheduler import ReminderScheduler
+from dedupe_store import DedupeStore
+from sharding import ShardLeases, shard_of
+from telegram_delivery import TelegramDelivery
+from email_delivery import SMTP_HOST, EmailDelivery
+from inbox import Inbox
+from pending_reminders import PendingReminders
+from risk_batch import RISK_BATCH_HOUR, clear_alerts, pending_alerts, run_batch
 
 # ================== ENV ==================
 
@@ -19,333 +35,371 @@ if not BOT_TOKEN:
 
 SPREADSHEET_ID = "1wGnF_bV3pNMx2l3BtwXEfKFdbs3ToYsgxqqgnKBAqgU"
 spreadsheet = open_spreadsheet(SPREADSHEET_ID)
+store = open_store(spreadsheet)
 
 ATTENDANCE_REMINDER_MINUTES = 5        # After lecture end
 TIMETABLE_REMINDER_HOUR = 21           # 9 PM
 TIMETABLE_REMINDER_MINUTE = 0
 
-MIN_ATTENDANCE_REQUIRED = 75
-
-# ================== RUNTIME CACHE ==================
-
-attendance_sent_cache = set()
-timetable_sent_cache = set()
-
-# ================== TELEGRAM ==================
-
-def send_telegram(chat_id, message):
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    try:
-        requests.post(url, json={
-            "chat_id": chat_id,
-            "text": message,
-            "parse_mode": "Markdown"
-        }, timeout=5)
-    except Exception as e:
-        print("Telegram error:", e)
-
+REMINDER_WAVES = 8                     # Each event reaches 1/8 of users per tick
+REMINDER_WAVE_SECONDS = 15             # Gap between waves
 
+# 0, 1, 2 ... for each worker on the host; picks its metrics port
+WORKER_INDEX = int(os.getenv("NOTIFY_WORKER_INDEX", 0))
 
-# ================== ATTENDANCE REMINDER ==================
-
-def attendance_reminders(sheet):
-    now = datetime.now()
-    today = now.strftime("%Y-%m-%d")
-    today_day = now.strftime("%A")
-
-    today_date = datetime.now().date()
-
-    if is_national_holiday(sheet, today_date):
-        return
-
+MIN_ATTENDANCE_REQUIRED = 75
 
-    timetable = sheet.worksheet("Timetable").get_all_records()
-    attendance = sheet.worksheet("Attendance").get_all_records()
-    settings = sheet.worksheet("Notification_Settings").get_all_records()
+# ================== SENT REMINDERS ==================
 
-    for lec in timetable:
-        user_id = lec["user_id"]
+# Persisted in the local store so restarts and parallel notifiers don't resend
+sent_reminders = DedupeStore(store)
+inbox = Inbox(store)
+pending_reminders = PendingReminders(store)
 
-        if is_today_user_holiday(spreadsheet, user_id):
-            continue
+# ================== TELEGRAM ==================
 
-        if lec["day"] != today_day:
-            continue
+_telegram = None
 
-        end_time = datetime.strptime(
-            f"{today} {lec['end_time']}", "%Y-%m-%d %H:%M"
-        )
 
-        delta = (now - end_time).total_seconds()
+def record_failure(channel):
+    # Deliveries finish after deliver() has returned; failures are counted here
+    def on_result(result):
+        if not result["ok"] and result["tag"]:
+            metrics.REMINDERS.inc(kind=result["tag"], channel=channel, outcome="failed")
+    return on_result
 
-        if not (0 <= delta <= ATTENDANCE_REMINDER_MINUTES * 60):
-            continue
 
-        key = (user_id, lec["subject"], lec["start_time"], today)
-        if key in attendance_sent_cache:
-            continue
+def get_telegram():
+    # Started lazily so importing this module (e.g. from app.py) stays cheap
+    global _telegram
+    if _telegram is None:
+        _telegram = TelegramDelivery(BOT_TOKEN, on_result=record_failure("telegram"))
+        # Queued messages are already claimed in the dedupe store; deliver
+        # them before the worker thread dies with the process
+        atexit.register(_telegram.close)
+    return _telegram
 
-        already_marked = any(
-            a for a in attendance
-            if str(a["user_id"]) == str(user_id)
-            and a["date"] == today
-            and a["subject"] == lec["subject"]
-            and a["start_time"] == lec["start_time"]
-        )
 
-        if already_marked:
-            continue
+def send_telegram(chat_id, message, kind=None):
+    # Queued; the delivery worker handles pooling, rate limits and retries.
+    # False when the queue is full and the message was not accepted.
+    return get_telegram().send(chat_id, message, tag=kind)
 
-        for s in settings:
-            if (
-                str(s["user_id"]) == str(user_id)
-                and s["telegram"] == "yes"
-                and s.get("telegram_chat_id")
-            ):
-                send_telegram(
-                    s["telegram_chat_id"],
-                    f"⚠️ *Attendance Reminder*\n\n"
-                    f"📘 *{lec['subject']}*\n"
-                    f"🕒 {lec['start_time']} – {lec['end_time']}\n\n"
-                    f"Please mark your attendance."
-                )
-                attendance_sent_cache.add(key)
 
+# ================== EMAIL ==================
 
-# ================== NEXT-DAY TIMETABLE ==================
+_email = None
 
-def timetable_reminders(sheet):
-    now = datetime.now()
 
-    if now.hour != TIMETABLE_REMINDER_HOUR or now.minute != TIMETABLE_REMINDER_MINUTE:
-        return
+def get_email():
+    # None when no SMTP server is configured; email reminders are then skipped
+    global _email
+    if _email is None and SMTP_HOST:
+        _email = EmailDelivery(on_result=record_failure("email"))
+        atexit.register(_email.close)
+    return _email
 
-    tomorrow = now + timedelta(days=1)
-    tomorrow_day = tomorrow.strftime("%A")
-    tomorrow_date = tomorrow.strftime("%Y-%m-%d")
 
-    if is_national_holiday(sheet, tomorrow.date()):
-        return
+def plain_text(message):
+    return message.replace("*", "")
 
-    timetable = sheet.worksheet("Timetable").get_all_records()
-    settings = sheet.worksheet("Notification_Settings").get_all_records()
 
-    users = set(str(l["user_id"]) for l in timetable)
+# ================== DELIVERY ==================
 
-    for user_id in users:
-        if is_today_user_holiday(spreadsheet, user_id):
-            continue
+def targets(recipient, email):
+    """(channel, address) for each enabled channel of a recipient"""
+    channels = (
+        ("telegram", recipient.chat_id),
+        ("email", recipient.email if email else None),
+        ("in_app", recipient.in_app),
+    )
+    return [(channel, target) for channel, target in channels if target]
 
-        lectures = [
-            l for l in timetable
-            if str(l["user_id"]) == str(user_id)
-            and l["day"] == tomorrow_day
-        ]
 
-        if not lectures:
+def send_to(channel, target, user_id, kind, title, message, email, in_app):
+    """Returns False when the message could not even be queued."""
+    if channel == "telegram":
+        return send_telegram(target, message, kind)
+    if channel == "email":
+        email.send(target, title, plain_text(message), kind)
+    else:
+        in_app.append((user_id, kind, title, plain_text(message)))
+    return True
+
+
+def deliver(reminders, kind, now=None):
+    """
+    Fan planned reminders out to each enabled channel. Every channel is
+    claimed separately in the dedupe store, all in one transaction; emails
+    go out as one batch and in-app rows in one transaction. Users in digest
+    mode get the reminder queued instead (see flush_digests).
+    """
+    email = get_email()
+    in_app = []
+
+    digests = [r for r in reminders if r.recipient.digest_minutes]
+    sends = [
+        (r, channel, target)
+        for r in reminders if not r.recipient.digest_minutes
+        for channel, target in targets(r.recipient, email)
+    ]
+    claimed = sent_reminders.claim_many(
+        [r.key + ("digest",) for r in digests]
+        + [r.key + (channel,) for r, channel, _ in sends]
+    )
+
+    outcomes = Counter()         # (channel, outcome) -> count, added to REMINDERS once
+    queued = []
+    for r in digests:
+        outcomes["digest", "planned"] += 1
+        if r.key + ("digest",) in claimed:
+            queued.append((
+                r.user_id, kind, r.key, r.title, r.summary, r.recipient.digest_minutes
+            ))
+            outcomes["digest", "queued"] += 1
+        else:
+            outcomes["digest", "deduped"] += 1
+    if queued:
+        pending_reminders.add_many(queued, now.timestamp() if now else None)
+
+    unsent = []
+    for r, channel, target in sends:
+        outcomes[channel, "planned"] += 1
+        key = r.key + (channel,)
+        if key not in claimed:
+            outcomes[channel, "deduped"] += 1
             continue
-
-        key = (user_id, tomorrow_date)
-        if key in timetable_sent_cache:
+        if not send_to(channel, target, r.user_id, kind, r.title, r.message, email, in_app):
+            unsent.append(key)      # counted as failed by record_failure
             continue
+        outcomes[channel, "sent"] += 1
+
+    # Not attempted, so not sent: let the next event or replay try again
+    if unsent:
+        sent_reminders.release_many(unsent)
+    for (channel, outcome), count in outcomes.items():
+        metrics.REMINDERS.inc(count, kind=kind, channel=channel, outcome=outcome)
+    inbox.post_many(in_app)
+    if email:
+        email.flush()
+
+
+def flush_digests(store, now=None, owns=None):
+    """Send one combined message per user whose digest window has closed."""
+    now = now or datetime.now()
+    due = pending_reminders.pop_due(now.timestamp(), owns)
+    if not due:
+        return
 
-        message = f"📅 *Tomorrow's Timetable ({tomorrow_day})*\n\n"
-        for lec in lectures:
-            message += (
-                f"📘 {lec['subject']}\n"
-                f"🕒 {lec['start_time']} – {lec['end_time']}\n\n"
-            )
-
-        for s in settings:
-            if (
-                str(s["user_id"]) == str(user_id)
-                and s["telegram"] == "yes"
-                and s.get("telegram_chat_id")
-            ):
-                send_telegram(s["telegram_chat_id"], message)
-                timetable_sent_cache.add(key)
-
-
-def get_semester_dates(sheet, user_id):
-    ws = sheet.worksheet("Semester")
-    rows = ws.get_all_records()
-
-    for r in rows:
-        if str(r["user_id"]) == str(user_id):
-            start = datetime.strptime(r["semester_start"], "%Y-%m-%d").date()
-            end = datetime.strptime(r["semester_end"], "%Y-%m-%d").date()
-            return start, end
-
-    raise ValueError(f"Semester dates not set for user {user_id}")
-
-
-
-# ================== ATTENDANCE CALCULATION ==================
-
-def calculate_attendance(sheet, user_id):
-    timetable = sheet.worksheet("Timetable").get_all_records()
-    attendance = sheet.worksheet("Attendance").get_all_records()
-
-    semester_start, semester_end = get_semester_dates(sheet, user_id)
-    today = min(datetime.now().date(), semester_end)
-
-    total_lectures = 0
-    present = 0
+    email = get_email()
+    in_app = []
+    marked_by_day = {}
+    recipients_by_user = recipients(store)
 
-    for lec in timetable:
-        if str(lec["user_id"]) != str(user_id):
+    for user_id, items in due.items():
+        items = drop_marked(store, items, marked_by_day)
+        recipient = recipients_by_user.get(user_id)
+        if not items or not recipient:
             continue
 
-        current_date = semester_start
-
-        while current_date <= today:
-            if current_date.strftime("%A") != lec["day"]:
-                current_date += timedelta(days=1)
-                continue
-
-            # Skip holidays
-            if is_national_holiday(sheet, current_date):
-                current_date += timedelta(days=1)
-                continue
-
-            if is_user_holiday(spreadsheet, user_id, current_date):
-                current_date += timedelta(days=1)
-                continue
-            #removed total_lectures += 1 from here
-
-            record = next(
-                (a for a in attendance
-                if str(a["user_id"]) == str(user_id)
-                and a["date"] == current_date.strftime("%Y-%m-%d")
-                and a["subject"] == lec["subject"]
-                and a["start_time"] == lec["start_time"]),
-                None
+        message = combined_message(items, unmarked_today(store, user_id, now, marked_by_day))
+        for channel, target in targets(recipient, email):
+            send_to(
+                channel, target, user_id, "digest", "Your AttendSmart reminders",
+                message, email, in_app
             )
+            metrics.REMINDERS.inc(kind="digest", channel=channel, outcome="sent")
 
-            # Skip OFF lectures completely
-            if record and record["status"] == "Off":
-                current_date += timedelta(days=1)
-                continue
-
-            total_lectures += 1
+    inbox.post_many(in_app)
+    if email:
+        email.flush()
 
-            if record and record["status"] == "Yes":
-                present += 1
 
+# ================== ATTENDANCE REMINDER ==================
 
-            current_date += timedelta(days=1)
-
-    # ---- ZERO ATTENDANCE GUARD ----
-    if total_lectures == 0:
-        return {
-            "attendance_pct": 0,
-            "present": 0,
-            "total": 0
-        }
+def attendance_reminders(store, now=None, end_minute=None, owns=None):
+    """
+    Remind users who haven't marked lectures that just ended.
+    end_minute: only lectures ending at this minute (scheduler events);
+    otherwise any lecture that ended in the last ATTENDANCE_REMINDER_MINUTES.
+    owns: optional user_id predicate limiting this worker to its shards.
+    """
+    now = now or datetime.now()
 
-    attendance_pct = round((present / total_lectures) * 100, 2)
+    deliver(plan_attendance(store, now, end_minute, owns), "attendance", now)
 
-    return {
-        "attendance_pct": attendance_pct,
-        "present": present,
-        "total": total_lectures
-    }
 
+# ================== NEXT-DAY TIMETABLE ==================
 
+def timetable_reminders(store, now=None, owns=None):
+    """Send tomorrow's timetable; timing is owned by the scheduler."""
+    now = now or datetime.now()
 
+    deliver(plan_digest(store, now, owns), "timetable", now)
 
-# ================== RISK PREDICTION ==================
 
-def predict_risk(sheet, user_id, minimum_required=75):
-    stats = calculate_attendance(sheet, user_id)
+# ================== RISK ALERTS ==================
 
-    present = stats["present"]
-    total = stats["total"]
+def nightly_risk_batch(store, owner, now=None):
+    """Once a day after RISK_BATCH_HOUR, by whichever worker gets the lease."""
+    now = now or datetime.now()
+    today = str(now.date())
+    if now.hour < RISK_BATCH_HOUR or store.get_meta("risk_batch_date") == today:
+        return
+    if not store.acquire_lease("risk-batch", owner, 3600):
+        return
+    try:
+        if store.get_meta("risk_batch_date") != today:
+            started = datetime.now()
+            count = run_batch(store, now.date())
+            metrics.log(
+                "risk_batch", users=count,
+                seconds=round((datetime.now() - started).total_seconds(), 2)
+            )
+    finally:
+        store.release_lease("risk-batch", owner)
 
-    # ---- ZERO ATTENDANCE GUARD ----
-    if total == 0:
-        return {
-            "current_pct": 0,
-            "projected_pct": 0,
-            "future_lectures": 0,
-            "risk": "UNKNOWN",
-            "message": "Not enough attendance data yet."
-        }
 
-    current_pct = stats["attendance_pct"]
+def nightly_inbox_prune(store, now=None):
+    """Once a day after RISK_BATCH_HOUR, drop read in-app notifications past
+    INBOX_RETENTION. Idempotent, so two workers racing here is harmless."""
+    now = now or datetime.now()
+    today = str(now.date())
+    if now.hour < RISK_BATCH_HOUR or store.get_meta("inbox_prune_date") == today:
+        return
+    store.set_meta("inbox_prune_date", today)
+    inbox.prune()
 
 
-    timetable = sheet.worksheet("Timetable").get_all_records()
-    semester_start, semester_end = get_semester_dates(sheet, user_id)
+def risk_alerts(store, owns=None):
+    """Tell users whose nightly risk just got worse (HIGH or CRITICAL)."""
+    alerts = pending_alerts(store, owns)
+    if not alerts:
+        return
 
-    today = datetime.now().date()
-    future_lectures = 0
+    email = get_email()
+    in_app = []
+    recipients_by_user = recipients(store)
 
-    for lec in timetable:
-        if str(lec["user_id"]) != str(user_id):
+    sends = []
+    for a in alerts:
+        recipient = recipients_by_user.get(a["user_id"])
+        if not recipient:
+            continue
+        for channel, target in targets(recipient, email):
+            key = ("risk", a["user_id"], a["as_of"], a["risk"], channel)
+            sends.append((a, channel, target, key))
+    claimed = sent_reminders.claim_many([key for *_, key in sends])
+
+    unsent = []
+    for a, channel, target, key in sends:
+        if key not in claimed:
+            continue
+        message = (
+            f"🚨 *Attendance risk: {a['risk']}*\n\n"
+            f"Your attendance is {a['current_pct']}% and is projected to reach "
+            f"{a['projected_pct']}% by the end of the semester.\n\n"
+            f"Open AttendSmart → Insights to see how many lectures you need to attend."
+        )
+        if not send_to(
+            channel, target, a["user_id"], "risk", f"Attendance risk: {a['risk']}",
+            message, email, in_app
+        ):
+            unsent.append((key, a["user_id"]))
             continue
+        metrics.REMINDERS.inc(kind="risk", channel=channel, outcome="sent")
 
-        date_ptr = today + timedelta(days=1)
+    # Keep refused alerts pending so the next tick tries them again
+    retry = set()
+    if unsent:
+        sent_reminders.release_many(key for key, _ in unsent)
+        retry = {user_id for _, user_id in unsent}
 
-        while date_ptr <= semester_end:
-            if date_ptr.strftime("%A") != lec["day"]:
-                date_ptr += timedelta(days=1)
-                continue
+    clear_alerts(store, [a["user_id"] for a in alerts if a["user_id"] not in retry])
+    inbox.post_many(in_app)
+    if email:
+        email.flush()
 
-            if is_national_holiday(sheet, date_ptr):
-                date_ptr += timedelta(days=1)
-                continue
 
-            if is_user_holiday(spreadsheet, user_id, date_ptr):
-                date_ptr += timedelta(days=1)
-                continue
+# ================== ATTENDANCE CALCULATION ==================
+# All three read the same memoized per-user snapshot (see snapshot.py)
 
+def calculate_attendance(store, user_id):
+    return get_snapshot(store, user_id).stats
 
-            future_lectures += 1
-            date_ptr += timedelta(days=1)
 
-    projected_pct = round(
-        (present / (total + future_lectures)) * 100, 2
-    ) if (total + future_lectures) else 100
+# ================== RISK PREDICTION ==================
 
-    if current_pct < minimum_required:
-        risk = "CRITICAL"
-        message = "Your attendance is already below the minimum requirement."
-    elif projected_pct < minimum_required:
-        risk = "HIGH"
-        message = "You may fall below the minimum attendance if lectures are missed."
-    elif current_pct < minimum_required + 5:
-        risk = "BORDERLINE"
-        message = "You are close to the minimum attendance threshold."
-    else:
-        risk = "SAFE"
-        message = "Your attendance is safe."
+def predict_risk(store, user_id, minimum_required=75):
+    return get_snapshot(store, user_id, minimum_required).risk
 
-    return {
-        "current_pct": current_pct,
-        "projected_pct": projected_pct,
-        "future_lectures": future_lectures,
-        "risk": risk,
-        "message": message
-    }
 
+# ================== SKIP / RECOVERY BUDGET ==================
+
+def attendance_budget(store, user_id, minimum_required=75):
+    """
+    Skip and recovery budget overall and per subject (see planning.budget).
+    Overall figures use the scheduled-lecture stats; subjects use their
+    marked totals, each against its remaining scheduled lectures.
+    """
+    return get_snapshot(store, user_id, minimum_required).budget
 
 
 # ================== MAIN LOOP ==================
 
-def run():
-    sheet = spreadsheet
-    print("✅ Notification service started")
+def build_worker(store, shards, clock=datetime.now, sleep=time.sleep):
+    """
+    The scheduler and per-tick upkeep of one notifier worker; sheet edits
+    are pulled by a storage.Refresher next to it, not on the tick.
+    Returns (scheduler, before_tick); loadtest.py drives the same pair.
+    """
+    def in_wave(wave):
+        return lambda user_id: (
+            shards.owns(user_id) and shard_of(user_id, REMINDER_WAVES) == wave
+        )
 
-    while True:
-        try:
-            attendance_reminders(sheet)
-            timetable_reminders(sheet)
-        except Exception as e:
-            print("❌ Notification error:", e)
+    scheduler = ReminderScheduler(
+        store,
+        on_attendance=lambda due, end_minute, wave: attendance_reminders(
+            store, due, end_minute, owns=in_wave(wave)
+        ),
+        on_digest=lambda due, wave: timetable_reminders(store, due, owns=in_wave(wave)),
+        attendance_delay=ATTENDANCE_REMINDER_MINUTES,
+        digest_hour=TIMETABLE_REMINDER_HOUR,
+        digest_minute=TIMETABLE_REMINDER_MINUTE,
+        waves=REMINDER_WAVES,
+        wave_seconds=REMINDER_WAVE_SECONDS,
+        clock=clock,
+        sleep=sleep,
+    )
+
+    def before_tick():
+        now = clock()
+        acquired = shards.refresh()
+        if acquired:
+            metrics.log("shards_acquired", worker=shards.owner, shards=sorted(acquired))
+            # Taken-over users may have missed recent reminders
+            scheduler.replay()
+        # Parse marks as they come in, so reminder waves find the table current
+        typed(store, "Attendance")
+        flush_digests(store, now, owns=shards.owns)
+        nightly_risk_batch(store, shards.owner, now)
+        nightly_inbox_prune(store, now)
+        risk_alerts(store, owns=shards.owns)
+
+    return scheduler, before_tick
 
-        time.sleep(60)
 
+def run():
+    # Start as many workers as needed; users are split between them by shard
+    shards = ShardLeases(store)
+    atexit.register(shards.release)
+    metrics.serve(metrics.NOTIFIER_PORT_OFFSET + WORKER_INDEX)
+    print(f"✅ Notification service started (worker {shards.owner})")
+
+    Refresher(store, spreadsheet).start()
+    scheduler, before_tick = build_worker(store, shards)
+    scheduler.run_forever(before_tick=before_tick)
 
 if __name__ == "__main__":
     run()
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+from calendar_engine import day_array, first_marks, lecture_dates, to_day
+from holidays import holidays_between
+from records import MarkTable, Status, parse_minutes, subject_id, subject_name, typed
+
+# Materialized semester calendar: one row per scheduled lecture of a user's
+# semester, holidays included but flagged. A user's rows are regenerated only
+# when their own Semester, Timetable or User_Holidays rows (or the national
+# holiday list) changed since they were built; every attendance figure is
+# then a masked sum over that user's rows, with marks joined on
+# (date, subject, start time).
+
+USER_TABLES = ("Semester", "Timetable", "User_Holidays")
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS Lecture_Occurrences ("
+    "user_id TEXT, date TEXT, subject TEXT, start_time TEXT, end_time TEXT, "
+    "holiday INTEGER)",
+
+    "CREATE INDEX IF NOT EXISTS idx_Lecture_Occurrences_user_id_date "
+    "ON Lecture_Occurrences (user_id, date)",
+
+    "CREATE TABLE IF NOT EXISTS Lecture_Occurrences_Built ("
+    "user_id TEXT PRIMARY KEY, version TEXT, semester_start TEXT, "
+    "semester_end TEXT, built_at REAL)",
+]
+
+
+def install(conn):
+    """Create the occurrence tables (idempotent)."""
+    for sql in SCHEMA:
+        conn.execute(sql)
+
+
+def get_semester_dates(store, user_id):
+    r = store.semester.first(user_id=user_id)
+
+    if r:
+        start = datetime.strptime(r["semester_start"], "%Y-%m-%d").date()
+        end = datetime.strptime(r["semester_end"], "%Y-%m-%d").date()
+        return start, end
+
+    raise ValueError(f"Semester dates not set for user {user_id}")
+
+
+def user_holiday_dates(store, user_id, start, end):
+    return day_array(holidays_between(store, user_id, start, end))
+
+
+# ================== MATERIALIZE ==================
+
+def occurrence_version(store, user_id):
+    """
+    Stamp of what a user's calendar is built from: a digest of their own
+    rows in USER_TABLES plus the National_Holidays version. Another user's
+    edits leave it unchanged.
+    """
+    digest = hashlib.sha1()
+    for name in USER_TABLES:
+        rows = store.query(
+            f"SELECT * FROM {name} WHERE user_id = ? ORDER BY rowid", [str(user_id)]
+        )
+        digest.update(json.dumps([name, rows], default=str).encode())
+    return f"{store.version('National_Holidays')}:{digest.hexdigest()}"
+
+
+def materialize(store, user_id):
+    """
+    Regenerate a user's occurrences if their sources changed since the last
+    build. Returns (semester_start, semester_end).
+    """
+    user_id = str(user_id)
+    version = occurrence_version(store, user_id)
+
+    built = store.query(
+        "SELECT version, semester_start, semester_end FROM Lecture_Occurrences_Built "
+        "WHERE user_id = ?",
+        [user_id]
+    )
+    if built and built[0][0] == version:
+        return tuple(datetime.strptime(d, "%Y-%m-%d").date() for d in built[0][1:])
+
+    start, end = get_semester_dates(store, user_id)
+    holidays = user_holiday_dates(store, user_id, start, end)
+
+    rows = []
+    for lec in typed(store, "Timetable").for_user(user_id):
+        dates = lecture_dates(lec.weekday, start, end)
+        flags = np.isin(dates, holidays)
+        rows += [
+            (user_id, str(d), lec.subject_name, lec.start_time, lec.end_time, int(f))
+            for d, f in zip(dates, flags)
+        ]
+
+    with store.transaction() as conn:
+        conn.execute("DELETE FROM Lecture_Occurrences WHERE user_id = ?", [user_id])
+        conn.executemany(
+            "INSERT INTO Lecture_Occurrences "
+            "(user_id, date, subject, start_time, end_time, holiday) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO Lecture_Occurrences_Built "
+            "(user_id, version, semester_start, semester_end, built_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [user_id, version, str(start), str(end), time.time()]
+        )
+    return start, end
+
+
+# ================== INDEX ==================
+
+def mark_key(day, subject, start):
+    """Same packing as calendar_engine.first_marks"""
+    return (
+        (day.astype("i8") << 32)
+        | (np.asarray(subject).astype("i8") << 11)
+        | np.asarray(start).astype("i8")
+    )
+
+
+class OccurrenceIndex:
+    """
+    One user's semester occurrences as parallel arrays, each carrying the
+    status of its first mark (Status.OTHER when unmarked).
+    """
+
+    __slots__ = (
+        "user_id", "semester_start", "semester_end",
+        "day", "subject", "start", "end", "holiday", "status",
+    )
+
+    def __init__(self, user_id, semester_start, semester_end, rows, marks):
+        self.user_id = str(user_id)
+        self.semester_start = semester_start
+        self.semester_end = semester_end
+
+        self.day = np.array([r[0] for r in rows], dtype="datetime64[D]")
+        self.subject = np.array([subject_id(r[1]) for r in rows], dtype=np.int64)
+        self.start = np.array([parse_minutes(r[2]) for r in rows], dtype=np.int64)
+        self.end = np.array([parse_minutes(r[3]) for r in rows], dtype=np.int64)
+        self.holiday = np.array([bool(r[4]) for r in rows], dtype=bool)
+
+        self.status = np.full(len(rows), Status.OTHER, dtype=np.int8)
+        marks = first_marks(marks)
+        if len(marks) and len(rows):
+            keys = mark_key(marks["day"], marks["subject"], marks["start"])
+            order = np.argsort(keys)
+            keys = keys[order]
+            wanted = mark_key(self.day, self.subject, self.start)
+            pos = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+            hit = keys[pos] == wanted
+            self.status[hit] = marks["status"][order][pos[hit]]
+
+    def __len__(self):
+        return len(self.day)
+
+    # ---------- Masks ----------
+
+    def held(self, today):
+        """Lectures held up to today (holidays out), 'Off' ones not counted"""
+        mask = ~self.holiday & (self.day <= to_day(min(today, self.semester_end)))
+        return mask & (self.status != Status.OFF)
+
+    def upcoming(self, today):
+        return ~self.holiday & (self.day > to_day(today))
+
+    # ---------- Figures ----------
+
+    def stats(self, today):
+        held = self.held(today)
+        present = int((held & (self.status == Status.YES)).sum())
+        total = int(held.sum())
+
+        if total == 0:
+            return {
+                "attendance_pct": 0,
+                "present": 0,
+                "total": 0
+            }
+
+        return {
+            "attendance_pct": round((present / total) * 100, 2),
+            "present": present,
+            "total": total
+        }
+
+    def subjects(self, today):
+        """{subject: {"present", "total", "off"}}; unmarked lectures count as absent"""
+        past = ~self.holiday & (self.day <= to_day(min(today, self.semester_end)))
+        held = past & (self.status != Status.OFF)
+        n = int(self.subject.max()) + 1 if len(self) else 0
+
+        present = np.bincount(self.subject[held & (self.status == Status.YES)], minlength=n)
+        total = np.bincount(self.subject[held], minlength=n)
+        off = np.bincount(self.subject[past & (self.status == Status.OFF)], minlength=n)
+
+        return {
+            subject_name(s): {
+                "present": int(present[s]), "total": int(total[s]), "off": int(off[s])
+            }
+            for s in sorted(set(self.subject.tolist()), key=subject_name)
+        }
+
+    def weekly(self, today):
+        """[(week_start, pct)] for weeks with at least one counted lecture"""
+        held = self.held(today)
+        day = self.day[held]
+        week = day - ((day.astype("i8") + 3) % 7)       # back to Monday
+        weeks, inverse = np.unique(week, return_inverse=True)
+        present = np.bincount(inverse, weights=self.status[held] == Status.YES)
+        counted = np.bincount(inverse, minlength=len(weeks))
+
+        return [
+            (str(w), round(p / c * 100, 2))
+            for w, p, c in zip(weeks, present.tolist(), counted.tolist())
+        ]
+
+    def future(self, today):
+        """{subject_id: lectures scheduled strictly after today}"""
+        counts = np.bincount(self.subject[self.upcoming(today)])
+        return {s: int(c) for s, c in enumerate(counts.tolist()) if c}
+
+
+def occurrence_index(store, user_id):
+    start, end = materialize(store, user_id)
+    rows = store.query(
+        "SELECT date, subject, start_time, end_time, holiday FROM Lecture_Occurrences "
+        "WHERE user_id = ? ORDER BY date, start_time",
+        [str(user_id)]
+    )
+    # Just this user's marks, so a render never waits on parsing the whole sheet
+    marks = MarkTable(store.attendance.where(user_id=str(user_id))).array
+    return OccurrenceIndex(user_id, start, end, rows, marks)
@@ -0,0 +1,80 @@
+import json
+import time
+
+# Reminders held back for users in digest mode (Notification_Settings
+# digest_minutes > 0). The first reminder opens a window of digest_minutes;
+# everything queued for the user before it closes goes out as one message.
+# Local to the store, so every notifier worker on the host shares it.
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS Pending_Reminders ("
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, kind TEXT, key TEXT, "
+    "title TEXT, summary TEXT, due_at REAL, created_at REAL)",
+
+    "CREATE INDEX IF NOT EXISTS idx_Pending_Reminders_user_id_due_at "
+    "ON Pending_Reminders (user_id, due_at)",
+]
+
+
+class PendingReminders:
+    def __init__(self, store):
+        self.store = store
+        with store.transaction() as conn:
+            for sql in SCHEMA:
+                conn.execute(sql)
+
+    def add(self, user_id, kind, key, title, summary, window_minutes, now=None):
+        """Queue a reminder, joining the user's open window or opening one."""
+        self.add_many([(user_id, kind, key, title, summary, window_minutes)], now)
+
+    def add_many(self, items, now=None):
+        """
+        add() for a batch in one transaction.
+        items: iterable of (user_id, kind, key, title, summary, window_minutes)
+        """
+        now = now or time.time()
+        with self.store.transaction() as conn:
+            for user_id, kind, key, title, summary, window_minutes in items:
+                due_at = conn.execute(
+                    "SELECT MIN(due_at) FROM Pending_Reminders WHERE user_id = ?",
+                    [str(user_id)]
+                ).fetchone()[0]
+                conn.execute(
+                    "INSERT INTO Pending_Reminders "
+                    "(user_id, kind, key, title, summary, due_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        str(user_id), kind, json.dumps(key), title, summary,
+                        due_at or now + window_minutes * 60, now,
+                    ]
+                )
+
+    def pop_due(self, now=None, owns=None):
+        """
+        Remove and return {user_id: [items]} for every user whose window has
+        closed. Select and delete share one transaction, so two workers never
+        take the same items.
+        """
+        now = now or time.time()
+        due = {}
+        with self.store.transaction() as conn:
+            users = [
+                u for (u,) in conn.execute(
+                    "SELECT user_id FROM Pending_Reminders "
+                    "GROUP BY user_id HAVING MIN(due_at) <= ?",
+                    [now]
+                )
+                if not owns or owns(u)
+            ]
+            for user_id in users:
+                rows = conn.execute(
+                    "SELECT kind, key, title, summary FROM Pending_Reminders "
+                    "WHERE user_id = ? ORDER BY id",
+                    [user_id]
+                ).fetchall()
+                conn.execute("DELETE FROM Pending_Reminders WHERE user_id = ?", [user_id])
+                due[user_id] = [
+                    {"kind": k, "key": tuple(json.loads(key)), "title": t, "summary": s}
+                    for k, key, t, s in rows
+                ]
+        return due
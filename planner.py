@@ -0,0 +1,261 @@
+from datetime import date, timedelta
+from functools import lru_cache
+
+from holidays import get_holiday_calendar
+from records import format_minutes, parse_day, parse_minutes, subject_id, subject_name, typed
+
+# Builds each tick's reminders as hash joins: lectures, today's marks,
+# recipients and leave are each turned into a dict/set once, then every
+# lecture is checked with O(1) lookups.
+
+ATTENDANCE_WINDOW_MINUTES = 5     # matches notifications.ATTENDANCE_REMINDER_MINUTES
+
+
+class Recipient:
+    """
+    Where one user wants reminders; a falsy field means the channel is off.
+    digest_minutes > 0 coalesces reminders into one message per window.
+    """
+
+    __slots__ = ("chat_id", "email", "in_app", "digest_minutes")
+
+    def __init__(self, chat_id=None, email=None, in_app=False, digest_minutes=0):
+        self.chat_id = chat_id
+        self.email = email
+        self.in_app = in_app
+        self.digest_minutes = digest_minutes
+
+
+class Reminder:
+    __slots__ = ("user_id", "recipient", "key", "title", "message", "summary")
+
+    def __init__(self, user_id, recipient, key, title, message, summary):
+        self.user_id = user_id
+        self.recipient = recipient
+        self.key = key
+        self.title = title
+        self.message = message
+        self.summary = summary      # shorter form used inside a digest
+
+
+# ---------- Lookups ----------
+
+_recipients_cache = {}
+
+
+def recipients(store):
+    """
+    user_id -> Recipient for users with at least one channel enabled,
+    rebuilt only when Notification_Settings changes.
+    """
+    version = store.version("Notification_Settings")
+    cached = _recipients_cache.get(id(store))
+    if cached and cached[0] == version:
+        return cached[1]
+
+    found = {}
+    for s in store.notification_settings.all():
+        user_id = str(s["user_id"])
+        if user_id in found:
+            continue
+        recipient = Recipient(
+            s.get("telegram_chat_id") if s.get("telegram") == "yes" else None,
+            s.get("email_id") if s.get("email") == "yes" else None,
+            s.get("in_app") == "yes",
+            digest_minutes(s),
+        )
+        if recipient.chat_id or recipient.email or recipient.in_app:
+            found[user_id] = recipient
+
+    _recipients_cache[id(store)] = (version, found)
+    return found
+
+
+def digest_minutes(settings):
+    try:
+        return max(int(settings.get("digest_minutes") or 0), 0)
+    except ValueError:
+        return 0
+
+
+# ---------- Messages ----------
+
+def attendance_message(lec):
+    return _attendance_texts(lec.subject, lec.start, lec.end)[0]
+
+
+def attendance_summary(lec):
+    return _attendance_texts(lec.subject, lec.start, lec.end)[1]
+
+
+@lru_cache(maxsize=4096)
+def _attendance_texts(subject, start, end):
+    # Shared by every user with the same lecture slot
+    name = subject_name(subject)
+    start_time, end_time = format_minutes(start), format_minutes(end)
+    return (
+        f"⚠️ *Attendance Reminder*\n\n"
+        f"📘 *{name}*\n"
+        f"🕒 {start_time} – {end_time}\n\n"
+        f"Please mark your attendance.",
+        f"📘 *{name}* 🕒 {start_time} – {end_time}",
+    )
+
+
+def digest_message(day_name, lectures):
+    message = f"📅 *Tomorrow's Timetable ({day_name})*\n\n"
+    for lec in lectures:
+        message += (
+            f"📘 {lec.subject_name}\n"
+            f"🕒 {lec.start_time} – {lec.end_time}\n\n"
+        )
+    return message
+
+
+# ---------- Plans ----------
+
+def plan_attendance(store, now, end_minute=None, owns=None):
+    """
+    Reminders for today's lectures ending at end_minute (or within the last
+    ATTENDANCE_WINDOW_MINUTES) that the user hasn't marked.
+    """
+    today = now.date()
+    calendar = get_holiday_calendar(store)
+    if calendar.national_title(today):
+        return []
+
+    timetable = typed(store, "Timetable")
+
+    if end_minute is not None:
+        ends = [end_minute]
+    else:
+        now_seconds = now.hour * 3600 + now.minute * 60 + now.second
+        ends = [
+            m for m in range(now_seconds // 60 - ATTENDANCE_WINDOW_MINUTES, now_seconds // 60 + 1)
+            if 0 <= now_seconds - m * 60 <= ATTENDANCE_WINDOW_MINUTES * 60
+        ]
+
+    lectures = [lec for m in ends for lec in timetable.ending(today.weekday(), m)]
+    if not lectures:
+        return []
+
+    marked = typed(store, "Attendance").marked_on(today)
+    recipients_by_user = recipients(store)
+    on_leave = calendar.users_on_leave(today)
+    day = today.strftime("%Y-%m-%d")
+
+    reminders = []
+    for lec in lectures:
+        user_id = lec.user_id
+        recipient = recipients_by_user.get(user_id)
+        if (
+            not recipient
+            or (owns and not owns(user_id))
+            or user_id in on_leave
+            or (user_id, lec.subject, lec.start) in marked
+        ):
+            continue
+        reminders.append(Reminder(
+            user_id,
+            recipient,
+            ("attendance", user_id, lec.subject_name, lec.start_time, day),
+            f"Attendance reminder: {lec.subject_name} {lec.start_time}",
+            attendance_message(lec),
+            attendance_summary(lec),
+        ))
+    return reminders
+
+
+def plan_digest(store, now, owns=None):
+    """Next-day timetable per user, skipped for users on leave today."""
+    tomorrow = now + timedelta(days=1)
+    calendar = get_holiday_calendar(store)
+    if calendar.national_title(tomorrow.date()):
+        return []
+
+    timetable = typed(store, "Timetable")
+    weekday = tomorrow.weekday()
+    on_leave = calendar.users_on_leave(now.date())
+    day_name = tomorrow.strftime("%A")
+    day = tomorrow.strftime("%Y-%m-%d")
+
+    reminders = []
+    for user_id, recipient in recipients(store).items():
+        if (owns and not owns(user_id)) or user_id in on_leave:
+            continue
+        lectures = [lec for lec in timetable.for_user(user_id) if lec.weekday == weekday]
+        if not lectures:
+            continue
+        message = digest_message(day_name, lectures)
+        reminders.append(Reminder(
+            user_id,
+            recipient,
+            ("timetable", user_id, day),
+            f"Tomorrow's timetable ({day_name})",
+            message,
+            message.rstrip(),
+        ))
+    return reminders
+
+
+# ---------- Digest mode ----------
+
+def marked_on(store, day, marked_by_day):
+    """typed(...).marked_on(day), scanned once per day per marked_by_day dict"""
+    if day not in marked_by_day:
+        marked_by_day[day] = typed(store, "Attendance").marked_on(
+            date.fromordinal(parse_day(day))
+        )
+    return marked_by_day[day]
+
+
+def unmarked_today(store, user_id, now, marked_by_day=None):
+    """
+    Lectures of the user that have ended today and are still unmarked.
+    Pass the same marked_by_day dict across users to scan today's marks once.
+    """
+    today = now.date()
+    calendar = get_holiday_calendar(store)
+    if calendar.national_title(today) or calendar.user_title(user_id, today):
+        return 0
+
+    minute = now.hour * 60 + now.minute
+    marked = marked_on(
+        store, today.strftime("%Y-%m-%d"), {} if marked_by_day is None else marked_by_day
+    )
+    return sum(
+        1 for lec in typed(store, "Timetable").for_user(user_id)
+        if lec.weekday == today.weekday()
+        and lec.end <= minute
+        and (lec.user_id, lec.subject, lec.start) not in marked
+    )
+
+
+def drop_marked(store, items, marked_by_day=None):
+    """
+    Queued items minus attendance reminders whose lecture got marked since.
+    Pass the same marked_by_day dict across users to scan each day once.
+    """
+    marked_by_day = {} if marked_by_day is None else marked_by_day
+    pending = []
+    for item in items:
+        if item["kind"] == "attendance":
+            _, user_id, subject, start_time, day = item["key"]
+            marked = marked_on(store, day, marked_by_day)
+            if (str(user_id), subject_id(subject), parse_minutes(start_time)) in marked:
+                continue
+        pending.append(item)
+    return pending
+
+
+def combined_message(items, unmarked):
+    lines = ["🗂 *Reminder Digest*", ""]
+    if unmarked:
+        lines += [f"⚠️ *{unmarked} unmarked lecture{'s' if unmarked != 1 else ''} today*", ""]
+
+    attendance = [i["summary"] for i in items if i["kind"] == "attendance"]
+    if attendance:
+        lines += ["Please mark your attendance for:"] + attendance + [""]
+
+    lines += [i["summary"] + "\n" for i in items if i["kind"] != "attendance"]
+    return "\n".join(lines).rstrip()
@@ -0,0 +1,51 @@
+import numpy as np
+
+# Closed-form attendance budgets, vectorized over subjects.
+#
+# With threshold p (percent), `present` attended out of `total` counted:
+#   skippable   = largest s with present / (total + s) >= p
+#               = floor((100·present − p·total) / p)
+#   must_attend = smallest x with (present + x) / (total + x) >= p
+#               = ceil((p·total − 100·present) / (100 − p))
+#   reachable   = must_attend <= lectures still scheduled this semester
+
+
+def budget(present, total, future, threshold=75):
+    """
+    present, total, future: scalars or equal-length arrays.
+    Returns a dict of arrays (or scalars for scalar input).
+    """
+    present = np.asarray(present, dtype=np.int64)
+    total = np.asarray(total, dtype=np.int64)
+    future = np.asarray(future, dtype=np.int64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(total > 0, np.round(present * 100 / np.maximum(total, 1), 2), 0.0)
+        best_pct = np.where(
+            total + future > 0,
+            np.round((present + future) * 100 / np.maximum(total + future, 1), 2),
+            100.0,
+        )
+
+    surplus = 100 * present - threshold * total
+    skippable = np.maximum(np.floor_divide(surplus, threshold), 0)
+
+    if threshold >= 100:
+        must_attend = np.where(surplus >= 0, 0, -1)
+    else:
+        must_attend = np.maximum(-np.floor_divide(surplus, 100 - threshold), 0)
+
+    reachable = (must_attend >= 0) & (must_attend <= future)
+
+    result = {
+        "pct": pct,
+        "skippable": skippable,
+        "must_attend": must_attend,         # -1: can never reach the threshold
+        "future": future,
+        "reachable": reachable,
+        "best_pct": best_pct,
+    }
+    if present.ndim == 0:
+        return {k: v.item() for k, v in result.items()}
+    return result
+
@@ -0,0 +1,190 @@
+import os
+import random
+import threading
+import time
+
+import metrics
+from rate_limit import SharedTokenBucket
+
+# Sheets API allows 60 read and 60 write requests per minute per user
+# (a service account is one user); keep bursts small so a minute never overshoots.
+# The buckets are shared through the local store, so the budget is per host,
+# not per process.
+READS_PER_MINUTE = int(os.getenv("SHEETS_READS_PER_MINUTE", 60))
+WRITES_PER_MINUTE = int(os.getenv("SHEETS_WRITES_PER_MINUTE", 60))
+BURST = int(os.getenv("SHEETS_BURST", 10))
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0          # seconds
+BACKOFF_CAP = 32.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+READ_METHODS = {
+    "get_all_records", "get_all_values", "get", "batch_get",
+    "row_values", "col_values", "acell", "cell", "worksheets",
+}
+WRITE_METHODS = {
+    "append_row", "append_rows", "update", "batch_update", "update_cell",
+    "delete_rows", "insert_row", "insert_rows", "add_worksheet", "clear",
+}
+
+
+def status_code(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+# ================== SINGLE FLIGHT ==================
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Returns (result, shared) where shared is True for followers."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+# ================== CLIENT ==================
+
+class QuotaClient:
+    """
+    Wraps a gspread client. Every Sheets call passes through a read or write
+    token bucket, retries 429/5xx with jittered exponential backoff, and
+    identical concurrent reads are coalesced into one request.
+    """
+
+    def __init__(self, client, reads_per_minute=READS_PER_MINUTE,
+                 writes_per_minute=WRITES_PER_MINUTE, burst=BURST, sleep=time.sleep):
+        self.client = client
+        self.read_bucket = SharedTokenBucket("sheets-read", reads_per_minute / 60, burst)
+        self.write_bucket = SharedTokenBucket("sheets-write", writes_per_minute / 60, burst)
+        self.flight = SingleFlight()
+        self.sleep = sleep
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "coalesced": 0,
+            "throttled": 0,
+            "retried": 0,
+            "quota_errors": 0,
+            "failed": 0,
+        }
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self.stats[name] += n
+        metrics.SHEETS_REQUESTS.inc(n, event=name)
+
+    def snapshot(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def call(self, kind, fn):
+        bucket = self.write_bucket if kind == "write" else self.read_bucket
+
+        for attempt in range(MAX_RETRIES + 1):
+            wait = bucket.reserve()
+            if wait:
+                self._count("throttled")
+                self.sleep(wait)
+
+            self._count("calls")
+            try:
+                return fn()
+            except Exception as e:
+                code = status_code(e)
+                if code == 429:
+                    self._count("quota_errors")
+                    metrics.log("sheets_quota_error", level="warning", kind=kind, attempt=attempt)
+                if code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                    self._count("failed")
+                    raise
+                self._count("retried")
+                delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)
+                self.sleep(random.uniform(0, delay))
+
+    def read(self, key, fn):
+        result, shared = self.flight.do(key, lambda: self.call("read", fn))
+        if shared:
+            self._count("coalesced")
+        return result
+
+    def open_by_key(self, key):
+        spreadsheet = self.call("read", lambda: self.client.open_by_key(key))
+        return QuotaSpreadsheet(self, spreadsheet)
+
+
+class _Proxy:
+    def __init__(self, quota, target, key):
+        self._quota = quota
+        self._target = target
+        self._key = key
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name not in READ_METHODS | WRITE_METHODS:
+            return attr
+
+        def wrapped(*args, **kwargs):
+            fn = lambda: attr(*args, **kwargs)
+            if name in WRITE_METHODS:
+                return self._quota.call("write", fn)
+            key = (self._key, name, repr(args), repr(sorted(kwargs.items())))
+            return self._quota.read(key, fn)
+
+        return wrapped
+
+
+class QuotaSpreadsheet(_Proxy):
+    def __init__(self, quota, spreadsheet):
+        super().__init__(quota, spreadsheet, spreadsheet.id)
+        self._worksheets = {}
+        self._ws_lock = threading.Lock()
+
+    def worksheet(self, title):
+        # Opening a worksheet is a metadata read; do it once per title
+        with self._ws_lock:
+            cached = self._worksheets.get(title)
+        if cached:
+            return cached
+
+        ws = self._quota.read(
+            (self._key, "worksheet", title),
+            lambda: self._target.worksheet(title)
+        )
+        wrapped = _Proxy(self._quota, ws, (self._key, title))
+        with self._ws_lock:
+            self._worksheets[title] = wrapped
+        return wrapped
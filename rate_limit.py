@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import threading
+import time
+
+BUCKET_PATH = os.getenv("ATTENDSMART_DB", "attendsmart.db")
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, bursts up to `capacity`.
+    Thread-safe. `reserve()` never blocks, so async callers can sleep on
+    the returned delay themselves.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens=1):
+        """Take tokens now (possibly going negative) and return seconds to wait."""
+        with self._lock:
+            self._refill()
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available. Returns seconds waited."""
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose level lives in SQLite, so every process on the host
+    (Streamlit app, bot, notifier workers, CLIs) draws from one budget
+    instead of each getting the full rate. Uses wall-clock time, since
+    monotonic clocks are not comparable across processes.
+    """
+
+    def __init__(self, name, rate, capacity=None, path=BUCKET_PATH, clock=time.time):
+        super().__init__(rate, capacity, clock)
+        self.name = name
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS _rate_buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)"
+        )
+
+    def reserve(self, tokens=1):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT tokens, updated_at FROM _rate_buckets WHERE name = ?",
+                    [self.name]
+                ).fetchone()
+                now = self.clock()
+                level = self.capacity
+                if row:
+                    level = min(self.capacity, row[0] + max(now - row[1], 0) * self.rate)
+                level -= tokens
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO _rate_buckets (name, tokens, updated_at) "
+                    "VALUES (?, ?, ?)",
+                    [self.name, level, now]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        self.tokens = level
+        if level >= 0:
+            return 0.0
+        return -level / self.rate
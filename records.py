@@ -0,0 +1,257 @@
+import sys
+import threading
+from datetime import date, datetime
+from enum import IntEnum
+
+import numpy as np
+
+# Typed, parse-once views of Timetable and Attendance rows.
+# Dates are day ordinals (datetime64[D] in arrays), times are minutes since
+# midnight, status is a small int and subjects are interned to int ids.
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+WEEKDAY_INDEX = {d: i for i, d in enumerate(WEEKDAYS)}
+
+
+class Status(IntEnum):
+    OTHER = 0
+    YES = 1
+    NO = 2
+    OFF = 3
+
+
+STATUS_CODES = {"Yes": Status.YES, "No": Status.NO, "Off": Status.OFF}
+
+
+# ---------- Parsing ----------
+
+def parse_day(value):
+    """date or YYYY-MM-DD -> ordinal, None if unparsable"""
+    if isinstance(value, date):
+        return value.toordinal()
+    value = str(value)
+    try:
+        if len(value) == 10 and value[4] == value[7] == "-":
+            return date.fromisoformat(value).toordinal()    # ~25x faster than strptime
+        return datetime.strptime(value, "%Y-%m-%d").toordinal()
+    except ValueError:
+        return None
+
+
+def parse_minutes(value):
+    """'09:30' -> 570, None if unparsable"""
+    try:
+        hours, mins = str(value).split(":")[:2]
+        return int(hours) * 60 + int(mins)
+    except ValueError:
+        return None
+
+
+def format_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+_subject_ids = {}
+_subject_names = []
+_subject_lock = threading.Lock()
+
+
+def subject_id(name):
+    name = sys.intern(str(name))
+    sid = _subject_ids.get(name)
+    if sid is None:
+        with _subject_lock:
+            sid = _subject_ids.setdefault(name, len(_subject_names))
+            if sid == len(_subject_names):
+                _subject_names.append(name)
+    return sid
+
+
+def subject_name(sid):
+    return _subject_names[sid]
+
+
+# ================== TIMETABLE ==================
+
+class Lecture:
+    __slots__ = ("user_id", "weekday", "subject", "start", "end")
+
+    def __init__(self, user_id, weekday, subject, start, end):
+        self.user_id = user_id
+        self.weekday = weekday
+        self.subject = subject
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def from_row(cls, row):
+        weekday = WEEKDAY_INDEX.get(row["day"])
+        start = parse_minutes(row["start_time"])
+        end = parse_minutes(row["end_time"])
+        if weekday is None or start is None or end is None:
+            return None
+        return cls(str(row["user_id"]), weekday, subject_id(row["subject"]), start, end)
+
+    @property
+    def subject_name(self):
+        return subject_name(self.subject)
+
+    @property
+    def start_time(self):
+        return format_minutes(self.start)
+
+    @property
+    def end_time(self):
+        return format_minutes(self.end)
+
+
+class LectureTable:
+    __slots__ = ("rows", "by_user", "by_weekday", "by_end")
+
+    def __init__(self, rows):
+        self.rows = [lec for lec in map(Lecture.from_row, rows) if lec]
+        self.by_user = {}
+        self.by_weekday = {}
+        self.by_end = {}
+        for lec in self.rows:
+            self.by_user.setdefault(lec.user_id, []).append(lec)
+            self.by_weekday.setdefault(lec.weekday, []).append(lec)
+            self.by_end.setdefault((lec.weekday, lec.end), []).append(lec)
+
+    def for_user(self, user_id):
+        return self.by_user.get(str(user_id), [])
+
+    def on_weekday(self, weekday):
+        return self.by_weekday.get(weekday, [])
+
+    def ending(self, weekday, minute):
+        """Lectures on a weekday that end at `minute`"""
+        return self.by_end.get((weekday, minute), [])
+
+
+# ================== ATTENDANCE ==================
+
+MARK_DTYPE = np.dtype([
+    ("user_id", "i8"),
+    ("day", "M8[D]"),
+    ("subject", "i4"),
+    ("start", "i2"),
+    ("status", "i1"),
+])
+
+NO_MARKS = np.empty(0, dtype=MARK_DTYPE)
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class MarkTable:
+    """
+    Every Attendance row in one structured array, grouped by user (row order
+    kept within a user) with per-user slices. Built from `base` plus `rows`
+    when the rows were appended after everything base has parsed; the days
+    base already answered marked_on() for are carried over with the new
+    rows added, so a tick after a few marks doesn't rescan the whole day.
+    """
+
+    __slots__ = ("array", "last_id", "_spans", "_marked")
+
+    def __init__(self, rows, base=None):
+        self.last_id = base.last_id if base is not None else 0
+        parsed = []
+        for r in rows:
+            self.last_id = max(self.last_id, r.get("_id", 0))
+            try:
+                user_id = int(r["user_id"])
+            except (TypeError, ValueError):
+                continue
+            day = parse_day(r["date"])
+            start = parse_minutes(r["start_time"])
+            if day is None or start is None:
+                continue
+            parsed.append((
+                user_id,
+                day - EPOCH_ORDINAL,            # days since 1970-01-01, as M8[D] stores them
+                subject_id(r["subject"]),
+                start,
+                STATUS_CODES.get(r["status"], Status.OTHER),
+            ))
+
+        fresh = np.array(parsed, dtype=MARK_DTYPE) if parsed else NO_MARKS
+        array = np.concatenate([base.array, fresh]) if base is not None else fresh
+        self.array = array[np.argsort(array["user_id"], kind="stable")]
+
+        self._spans = None
+        self._marked = {}
+        if base is not None:
+            for day, marked in base._marked.items():
+                self._marked[day] = marked | _mark_set(fresh[fresh["day"] == day])
+
+    @property
+    def spans(self):
+        """{user_id: (lo, hi)} slice of array, built on first use"""
+        if self._spans is None:
+            users, first, counts = np.unique(
+                self.array["user_id"], return_index=True, return_counts=True
+            )
+            self._spans = {
+                str(u): (int(lo), int(lo + n)) for u, lo, n in zip(users, first, counts)
+            }
+        return self._spans
+
+    def for_user(self, user_id):
+        span = self.spans.get(str(user_id))
+        return self.array[span[0]:span[1]] if span else NO_MARKS
+
+    def marked_on(self, day):
+        """{(user_id, subject_id, start)} marked on a date"""
+        day = np.datetime64(day, "D")
+        if day not in self._marked:
+            self._marked[day] = _mark_set(self.array[self.array["day"] == day])
+        return self._marked[day]
+
+
+def _mark_set(rows):
+    return {
+        (str(u), s, t)
+        for u, s, t in zip(
+            rows["user_id"].tolist(), rows["subject"].tolist(), rows["start"].tolist()
+        )
+    }
+
+
+# ================== CACHE ==================
+
+TYPED_TABLES = {
+    "Timetable": LectureTable,
+    "Attendance": MarkTable,
+}
+
+# Tables that can extend a parsed copy with just the appended rows
+APPENDABLE = {"Attendance"}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def typed(store, worksheet):
+    """
+    Typed table for a worksheet, parsed once per store version. After
+    appends only, APPENDABLE tables parse just the new rows.
+    """
+    version = store.version(worksheet)
+    cache_key = (id(store), worksheet)
+
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+        if cached and cached[0] == version:
+            return cached[2]
+
+    rewrites = store.version(f"{worksheet}:rewrite")
+    if cached and cached[1] == rewrites and worksheet in APPENDABLE:
+        base = cached[2]
+        table = TYPED_TABLES[worksheet](store.table(worksheet).after(base.last_id), base)
+    else:
+        table = TYPED_TABLES[worksheet](store.table(worksheet).all())
+
+    with _cache_lock:
+        _cache[cache_key] = (version, rewrites, table)
+    return table
@@ -0,0 +1,307 @@
+"""
+Nightly cohort risk batch: attendance and risk for every user at once.
+
+Per shard of users it builds a users × dates matrix of scheduled lectures
+(weekly timetable counts, cut to each semester, minus national holidays and
+personal leave), sums it over the past and the rest of the semester, and
+joins first marks against the timetable for present / 'Off' counts. Shards
+run in a process pool; results land in Risk_Snapshot, which remembers the
+previous risk so the notifier can alert on drops without recomputing.
+
+    python risk_batch.py
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import numpy as np
+
+from holidays import get_holiday_calendar
+from records import Status, typed
+from snapshot import classify_risk
+
+RISK_BATCH_HOUR = 2                 # run after midnight, before anyone's awake
+RISK_BATCH_WORKERS = int(os.getenv("RISK_BATCH_WORKERS", os.cpu_count() or 1))
+RISK_BATCH_SHARD = 5000             # users per pool task
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Worse risks sort higher; alerts go out when a user moves up to HIGH or above
+RISK_ORDER = {"UNKNOWN": 0, "SAFE": 1, "BORDERLINE": 2, "HIGH": 3, "CRITICAL": 4}
+ALERT_RISKS = {"HIGH", "CRITICAL"}
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS Risk_Snapshot ("
+    "user_id TEXT PRIMARY KEY, as_of TEXT, present INTEGER, total INTEGER, "
+    "future INTEGER, current_pct REAL, projected_pct REAL, risk TEXT, "
+    "previous_risk TEXT, alert_pending INTEGER DEFAULT 0, updated_at REAL)",
+
+    "CREATE INDEX IF NOT EXISTS idx_Risk_Snapshot_alert_pending "
+    "ON Risk_Snapshot (alert_pending)",
+]
+
+
+def install(conn):
+    """Create Risk_Snapshot (idempotent); run by LocalStore._create_schema."""
+    for sql in SCHEMA:
+        conn.execute(sql)
+
+
+def epoch_day(d):
+    return d.toordinal() - EPOCH_ORDINAL
+
+
+# ================== SHARD COMPUTATION ==================
+
+def compute_shard(shard):
+    """
+    shard: dict of plain arrays for a block of users (see build_shards).
+    Returns (present, total, future) int arrays aligned with shard["users"].
+    Pure NumPy, so it runs in a worker process without the store.
+    """
+    n = len(shard["users"])
+    start = shard["semester_start"]             # epoch days, per user
+    end = shard["semester_end"]
+    today = shard["today"]
+    past_end = np.minimum(today, end)
+
+    lo = int(start.min()) if n else today
+    hi = int(max(end.max(), today)) if n else today
+    days = np.arange(lo, hi + 1)
+    weekday = (days + 3) % 7                     # 1970-01-01 was a Thursday
+
+    # users × dates: lectures scheduled that day, holidays and leave removed
+    matrix = shard["weekly"][:, weekday].astype(np.int16)
+    matrix[:, np.isin(days, shard["national"])] = 0
+    for row, leave_start, leave_end in shard["leave"]:
+        matrix[row, max(leave_start - lo, 0):max(leave_end - lo + 1, 0)] = 0
+
+    held_days = (days >= start[:, None]) & (days <= past_end[:, None])
+    upcoming = (days > today) & (days <= end[:, None])
+    scheduled_past = (matrix * held_days).sum(axis=1)
+    future = (matrix * upcoming).sum(axis=1)
+
+    # First marks of scheduled lectures on days that were actually held
+    row, day, status, multiplicity = (
+        shard["mark_row"], shard["mark_day"], shard["mark_status"], shard["mark_mult"]
+    )
+    held = (
+        (multiplicity > 0)
+        & (day >= start[row]) & (day <= past_end[row])
+        & (matrix[row, np.clip(day - lo, 0, len(days) - 1)] > 0)
+    )
+    present = np.bincount(
+        row[held & (status == Status.YES)],
+        weights=multiplicity[held & (status == Status.YES)], minlength=n
+    ).astype(np.int64)
+    off = np.bincount(
+        row[held & (status == Status.OFF)],
+        weights=multiplicity[held & (status == Status.OFF)], minlength=n
+    ).astype(np.int64)
+
+    return present, scheduled_past - off, future
+
+
+# ================== INPUTS ==================
+
+def semesters(store):
+    """{user_id: (start, end)} as epoch days, first row per user"""
+    found = {}
+    for r in store.semester.all():
+        user_id = str(r["user_id"])
+        if user_id in found:
+            continue
+        try:
+            start = datetime.strptime(r["semester_start"], "%Y-%m-%d").date()
+            end = datetime.strptime(r["semester_end"], "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            continue
+        found[user_id] = (epoch_day(start), epoch_day(end))
+    return found
+
+
+def build_shards(store, today, shard_size=RISK_BATCH_SHARD):
+    """Split every user with a semester into self-contained array shards."""
+    terms = semesters(store)
+    users = sorted(terms, key=lambda u: (len(u), u))
+    lectures = typed(store, "Timetable")
+    marks = typed(store, "Attendance")
+    calendar = get_holiday_calendar(store)
+    national = np.array(
+        [o - EPOCH_ORDINAL for o in calendar.national_sorted], dtype=np.int64
+    )
+
+    for offset in range(0, len(users), shard_size):
+        block = users[offset:offset + shard_size]
+        rows = {u: i for i, u in enumerate(block)}
+
+        block_lectures = [(i, lec) for u, i in rows.items() for lec in lectures.for_user(u)]
+        lec_row = np.array([i for i, _ in block_lectures], dtype=np.int64)
+        lec_weekday = np.array([lec.weekday for _, lec in block_lectures], dtype=np.int64)
+        lec_subject = np.array([lec.subject for _, lec in block_lectures], dtype=np.int64)
+        lec_start = np.array([lec.start for _, lec in block_lectures], dtype=np.int64)
+
+        weekly = np.zeros((len(block), 7), dtype=np.int16)
+        np.add.at(weekly, (lec_row, lec_weekday), 1)
+
+        leave = []
+        for u, i in rows.items():
+            starts, ends = calendar.intervals.get(u, ((), ()))
+            leave += [
+                (i, s - EPOCH_ORDINAL, e - EPOCH_ORDINAL) for s, e in zip(starts, ends)
+            ]
+
+        spans = [(marks.spans[u], i) for u, i in rows.items() if u in marks.spans]
+        index = np.concatenate(
+            [np.arange(a, b) for (a, b), _ in spans] or [np.empty(0, dtype=np.int64)]
+        )
+        m = marks.array[index]
+        mark_row = np.repeat(
+            np.array([i for _, i in spans], dtype=np.int64),
+            [b - a for (a, b), _ in spans]
+        )
+        mark_day = m["day"].astype("i8")
+
+        # First mark per (user, day, subject, start), like calendar_engine.first_marks
+        if len(m):
+            key = np.stack([mark_row, mark_day, m["subject"], m["start"]], axis=1)
+            _, first = np.unique(key, axis=0, return_index=True)
+            first = np.sort(first)
+            m, mark_row, mark_day = m[first], mark_row[first], mark_day[first]
+
+        # How many timetable slots each mark matches (usually 0 or 1)
+        n_subjects = int(max(lec_subject.max(initial=0), m["subject"].max(initial=0))) + 1
+
+        def slot_key(row, weekday, subject, start):
+            return ((row * 7 + weekday) * n_subjects + subject) * 1440 + start
+
+        slot_keys, slot_counts = np.unique(
+            slot_key(lec_row, lec_weekday, lec_subject, lec_start), return_counts=True
+        )
+        wanted = slot_key(
+            mark_row, (mark_day + 3) % 7, m["subject"].astype("i8"), m["start"].astype("i8")
+        )
+        if len(slot_keys):
+            pos = np.minimum(np.searchsorted(slot_keys, wanted), len(slot_keys) - 1)
+            mark_mult = np.where(slot_keys[pos] == wanted, slot_counts[pos], 0)
+        else:
+            mark_mult = np.zeros(len(wanted), dtype=np.int64)
+
+        yield {
+            "users": block,
+            "today": epoch_day(today),
+            "semester_start": np.array([terms[u][0] for u in block], dtype=np.int64),
+            "semester_end": np.array([terms[u][1] for u in block], dtype=np.int64),
+            "weekly": weekly,
+            "national": national,
+            "leave": leave,
+            "mark_row": mark_row,
+            "mark_day": mark_day,
+            "mark_status": m["status"],
+            "mark_mult": np.asarray(mark_mult, dtype=np.int64),
+        }
+
+
+# ================== RUN ==================
+
+def risk_rows(users, present, total, future, minimum_required=75):
+    """Same figures and labels as snapshot.UserAttendanceSnapshot.risk"""
+    rows = []
+    for user_id, p, t, f in zip(users, present.tolist(), total.tolist(), future.tolist()):
+        if t == 0:
+            rows.append((user_id, 0, 0, 0, 0, 0, "UNKNOWN"))
+            continue
+        current_pct = round((p / t) * 100, 2)
+        projected_pct = round((p / (t + f)) * 100, 2) if (t + f) else 100
+        risk, _ = classify_risk(current_pct, projected_pct, minimum_required)
+        rows.append((user_id, p, t, f, current_pct, projected_pct, risk))
+    return rows
+
+
+def run_batch(store, today=None, workers=RISK_BATCH_WORKERS, minimum_required=75,
+              shard_size=RISK_BATCH_SHARD):
+    """
+    Compute every user's risk and upsert Risk_Snapshot. Users who moved up
+    to HIGH or CRITICAL get alert_pending = 1. Returns the number of users.
+    """
+    today = today or datetime.now().date()
+    shards = list(build_shards(store, today, shard_size))
+
+    if workers > 1 and len(shards) > 1:
+        # Not fork: the caller has live threads (replicator, delivery) and
+        # an open SQLite handle that a forked child must not inherit
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(shards)),
+            mp_context=multiprocessing.get_context("forkserver"),
+        ) as pool:
+            results = list(pool.map(compute_shard, shards))
+    else:
+        results = [compute_shard(shard) for shard in shards]
+
+    rows = []
+    for shard, (present, total, future) in zip(shards, results):
+        rows += risk_rows(shard["users"], present, total, future, minimum_required)
+
+    with store.transaction() as conn:
+        previous = dict(conn.execute("SELECT user_id, risk FROM Risk_Snapshot"))
+        conn.executemany(
+            "INSERT OR REPLACE INTO Risk_Snapshot (user_id, as_of, present, total, "
+            "future, current_pct, projected_pct, risk, previous_risk, alert_pending, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    user_id, str(today), p, t, f, cur, proj, risk,
+                    previous.get(user_id),
+                    int(
+                        risk in ALERT_RISKS
+                        and user_id in previous
+                        and RISK_ORDER[risk] > RISK_ORDER.get(previous[user_id], 0)
+                    ),
+                    time.time(),
+                )
+                for user_id, p, t, f, cur, proj, risk in rows
+            ]
+        )
+    store.set_meta("risk_batch_date", str(today))
+    return len(rows)
+
+
+def pending_alerts(store, owns=None):
+    """Risk_Snapshot rows flagged for a "you dropped to HIGH" alert"""
+    rows = store.query(
+        "SELECT user_id, as_of, current_pct, projected_pct, risk, previous_risk "
+        "FROM Risk_Snapshot WHERE alert_pending = 1"
+    )
+    return [
+        {
+            "user_id": r[0], "as_of": r[1], "current_pct": r[2],
+            "projected_pct": r[3], "risk": r[4], "previous_risk": r[5],
+        }
+        for r in rows
+        if not owns or owns(r[0])
+    ]
+
+
+def clear_alerts(store, user_ids):
+    with store.transaction() as conn:
+        conn.executemany(
+            "UPDATE Risk_Snapshot SET alert_pending = 0 WHERE user_id = ?",
+            [(u,) for u in user_ids]
+        )
+
+
+if __name__ == "__main__":
+    from google_sheets import open_spreadsheet
+    from storage import open_store
+
+    SPREADSHEET_ID = "1wGnF_bV3pNMx2l3BtwXEfKFdbs3ToYsgxqqgnKBAqgU"
+    spreadsheet = open_spreadsheet(SPREADSHEET_ID)
+    store = open_store(spreadsheet, replicate=False)
+    store.refresh_from_sheets(spreadsheet)
+
+    started = time.perf_counter()
+    count = run_batch(store)
+    print(f"✅ Risk snapshot for {count} users in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,138 @@
+import heapq
+import time
+from datetime import datetime, timedelta
+
+import metrics
+from records import typed
+
+CATCH_UP_MINUTES = 60          # missed events older than this are dropped
+MAX_SLEEP_SECONDS = 60         # wake at least this often to notice timetable edits
+
+
+class ReminderScheduler:
+    """
+    Plans the day's reminders into a heap of due times and sleeps until the
+    next one, instead of polling every minute.
+
+    Events:
+    - ("attendance", end_minute): lectures ending at end_minute, due
+      `attendance_delay` minutes later
+    - ("digest", None): next-day timetable, due at digest_hour:digest_minute
+
+    Each event fires in `waves` parts, `wave_seconds` apart; the callbacks
+    get the wave number and handle only that slice of users, so no single
+    tick carries a whole institution's fan-out.
+
+    The plan is rebuilt only when the Timetable version changes or the date
+    rolls over. Events missed by less than CATCH_UP_MINUTES (slow ticks,
+    restarts) still fire.
+    """
+
+    def __init__(self, store, on_attendance, on_digest, attendance_delay,
+                 digest_hour, digest_minute, waves=1, wave_seconds=0,
+                 clock=datetime.now, sleep=time.sleep):
+        self.store = store
+        self.on_attendance = on_attendance
+        self.on_digest = on_digest
+        self.attendance_delay = timedelta(minutes=attendance_delay)
+        self.digest_time = timedelta(hours=digest_hour, minutes=digest_minute)
+        self.waves = waves
+        self.wave_gap = timedelta(seconds=wave_seconds)
+        self.clock = clock
+        self.sleep = sleep
+
+        self.heap = []
+        self.fired = set()
+        self.planned_for = None
+        self.planned_version = None
+
+    # ---------- Planning ----------
+
+    def plan(self, now):
+        day = now.date()
+        if day != self.planned_for:
+            self.fired = set()
+
+        midnight = datetime.combine(day, datetime.min.time())
+        events = {("digest", None): midnight + self.digest_time}
+
+        for lec in typed(self.store, "Timetable").on_weekday(day.weekday()):
+            due = midnight + timedelta(minutes=lec.end) + self.attendance_delay
+            events[("attendance", lec.end)] = due
+
+        self.heap = [
+            (due + wave * self.wave_gap, kind, arg, wave)
+            for (kind, arg), due in events.items()
+            for wave in range(self.waves)
+            if (kind, arg, wave) not in self.fired
+        ]
+        heapq.heapify(self.heap)
+
+        self.planned_for = day
+        self.planned_version = self.store.version("Timetable")
+
+    def needs_plan(self, now):
+        return (
+            self.planned_for != now.date()
+            or self.planned_version != self.store.version("Timetable")
+        )
+
+    def replay(self):
+        """
+        Re-arm today's events, e.g. after taking over another worker's
+        users; anything missed by less than CATCH_UP_MINUTES fires again.
+        """
+        self.fired = set()
+        self.planned_version = None
+
+    # ---------- Running ----------
+
+    def run_pending(self, now=None):
+        """Fire every event due by `now`. Returns the number fired."""
+        now = now or self.clock()
+        if self.needs_plan(now):
+            self.plan(now)
+
+        fired = 0
+        while self.heap and self.heap[0][0] <= now:
+            due, kind, arg, wave = heapq.heappop(self.heap)
+            self.fired.add((kind, arg, wave))
+
+            if now - due > timedelta(minutes=CATCH_UP_MINUTES):
+                continue
+
+            if kind == "attendance":
+                self.on_attendance(due, arg, wave)
+            else:
+                self.on_digest(due, wave)
+            metrics.EVENTS_FIRED.inc(kind=kind)
+            fired += 1
+
+        return fired
+
+    def seconds_until_next(self, now=None):
+        now = now or self.clock()
+        if not self.heap:
+            tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            wait = (tomorrow - now).total_seconds()
+        else:
+            wait = (self.heap[0][0] - now).total_seconds()
+        return max(0, min(wait, MAX_SLEEP_SECONDS))
+
+    def run_forever(self, before_tick=None):
+        while True:
+            started = time.perf_counter()
+            try:
+                if before_tick:
+                    before_tick()
+                fired = self.run_pending()
+            except Exception as e:
+                metrics.SCHEDULER_ERRORS.inc()
+                metrics.log("tick_failed", level="error", error=repr(e))
+            else:
+                elapsed = time.perf_counter() - started
+                metrics.TICK_SECONDS.observe(elapsed)
+                metrics.LAST_TICK.set(time.time())
+                if fired:
+                    metrics.log("tick", fired=fired, seconds=round(elapsed, 4))
+            self.sleep(self.seconds_until_next())
@@ -0,0 +1,86 @@
+import math
+import os
+import time
+import uuid
+import zlib
+
+SHARD_COUNT = int(os.getenv("NOTIFY_SHARDS", 16))
+SHARD_LEASE = 150               # seconds; must outlive the scheduler's longest sleep
+WORKER_PREFIX = "notify-worker:"
+SHARD_PREFIX = "notify-shard:"
+
+
+def shard_of(user_id, shards=SHARD_COUNT):
+    """Stable hash partition of a user_id (same in every process)."""
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+class ShardLeases:
+    """
+    Splits users between notifier workers through the store's lease table.
+
+    Every worker heartbeats a "notify-worker:<id>" lease and holds at most
+    its fair share (ceil(shards / live workers)) of "notify-shard:<n>"
+    leases. Workers that join pick up free shards as others shed extras;
+    a crashed worker's shards expire and are taken over. Sends stay
+    deduplicated through the shared Sent_Reminders store during hand-offs.
+    """
+
+    def __init__(self, store, shards=SHARD_COUNT, owner=None, ttl=SHARD_LEASE):
+        self.store = store
+        self.shards = shards
+        self.owner = owner or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.ttl = ttl
+        self.owned = set()
+
+    def _live(self, prefix):
+        rows = self.store.query(
+            "SELECT name, owner FROM _leases WHERE name LIKE ? AND expires_at >= ?",
+            [prefix + "%", time.time()]
+        )
+        return {name[len(prefix):]: owner for name, owner in rows}
+
+    def refresh(self):
+        """
+        Heartbeat, renew held shards and rebalance.
+        Returns the set of shards newly acquired by this worker.
+        """
+        self.store.acquire_lease(WORKER_PREFIX + self.owner, self.owner, self.ttl)
+        workers = max(1, len(self._live(WORKER_PREFIX)))
+        fair_share = math.ceil(self.shards / workers)
+
+        holders = self._live(SHARD_PREFIX)
+        owned = {
+            n for n in range(self.shards)
+            if holders.get(str(n)) == self.owner
+        }
+
+        # Shed extras so newly joined workers get their share
+        for n in sorted(owned)[fair_share:]:
+            self.store.release_lease(SHARD_PREFIX + str(n), self.owner)
+            owned.discard(n)
+
+        for n in sorted(owned):
+            if not self.store.acquire_lease(SHARD_PREFIX + str(n), self.owner, self.ttl):
+                owned.discard(n)
+
+        for n in range(self.shards):
+            if len(owned) >= fair_share:
+                break
+            if str(n) in holders:
+                continue
+            if self.store.acquire_lease(SHARD_PREFIX + str(n), self.owner, self.ttl):
+                owned.add(n)
+
+        acquired = owned - self.owned
+        self.owned = owned
+        return acquired
+
+    def owns(self, user_id):
+        return shard_of(user_id, self.shards) in self.owned
+
+    def release(self):
+        for n in self.owned:
+            self.store.release_lease(SHARD_PREFIX + str(n), self.owner)
+        self.store.release_lease(WORKER_PREFIX + self.owner, self.owner)
+        self.owned = set()
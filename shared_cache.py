@@ -0,0 +1,146 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+
+CACHE_PATH = os.getenv("ATTENDSMART_DB", "attendsmart.db")
+
+FETCH_LOCK_SECONDS = 30     # how long one process may hold a fetch lock
+FETCH_WAIT_SECONDS = 10     # how long others wait for it before serving the stale entry
+SWEEP_EVERY = 500           # puts between deletes of expired entries
+
+
+class SharedCache:
+    """
+    On-disk key/value cache shared by every process on the host
+    (Streamlit app, notifier, Telegram bot).
+
+    Entries carry a TTL and an optional version stamp; a lookup with a
+    different version is a miss. Misses are single-flight across processes:
+    one process fetches while the others wait for its result. A waiter that
+    gives up gets the stale entry rather than starting a second fetch.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS _cache ("
+            "key TEXT PRIMARY KEY, value BLOB, version INTEGER, "
+            "expires_at REAL, updated_at REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS _cache_locks ("
+            "key TEXT PRIMARY KEY, owner TEXT, expires_at REAL)"
+        )
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params)
+
+    # ---------- Entries ----------
+
+    def get(self, key, version=None, default=None):
+        row = self._execute(
+            "SELECT value, version, expires_at FROM _cache WHERE key = ?", [key]
+        ).fetchone()
+        if row is None:
+            return default
+
+        value, entry_version, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return default
+        if version is not None and entry_version != version:
+            return default
+        return pickle.loads(value)
+
+    def stale(self, key, default=None):
+        """The stored value whatever its age or version."""
+        row = self._execute("SELECT value FROM _cache WHERE key = ?", [key]).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def put(self, key, value, ttl=None, version=None):
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO _cache (key, value, version, expires_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [key, pickle.dumps(value), version, now + ttl if ttl else None, now]
+        )
+        self._puts += 1
+        if self._puts % SWEEP_EVERY == 0:
+            self.sweep()
+
+    def sweep(self):
+        """Delete expired entries and stale fetch locks."""
+        now = time.time()
+        self._execute("DELETE FROM _cache WHERE expires_at < ?", [now])
+        self._execute("DELETE FROM _cache_locks WHERE expires_at < ?", [now])
+
+    def invalidate(self, key):
+        self._execute("DELETE FROM _cache WHERE key = ?", [key])
+
+    def invalidate_prefix(self, prefix):
+        self._execute(
+            "DELETE FROM _cache WHERE substr(key, 1, ?) = ?", [len(prefix), prefix]
+        )
+
+    # ---------- Single-flight fetch ----------
+
+    def _acquire(self, key):
+        now = time.time()
+        self._execute(
+            "INSERT OR IGNORE INTO _cache_locks (key, owner, expires_at) VALUES (?, ?, ?)",
+            [key, self.owner, now + FETCH_LOCK_SECONDS]
+        )
+        cur = self._execute(
+            "UPDATE _cache_locks SET owner = ?, expires_at = ? "
+            "WHERE key = ? AND (owner = ? OR expires_at < ?)",
+            [self.owner, now + FETCH_LOCK_SECONDS, key, self.owner, now]
+        )
+        return cur.rowcount == 1
+
+    def _release(self, key):
+        self._execute(
+            "DELETE FROM _cache_locks WHERE key = ? AND owner = ?", [key, self.owner]
+        )
+
+    def get_or_fetch(self, key, fetch, ttl, version=None):
+        missing = object()
+
+        value = self.get(key, version, missing)
+        if value is not missing:
+            return value
+
+        deadline = time.time() + FETCH_WAIT_SECONDS
+        while not self._acquire(key):
+            if time.time() > deadline:
+                # The holder is slow, not gone (its lock has not expired):
+                # serve what we have instead of piling on a second fetch.
+                # Only a key that was never cached is fetched unlocked.
+                value = self.stale(key, missing)
+                if value is not missing:
+                    return value
+                break
+            time.sleep(0.1)
+            value = self.get(key, version, missing)
+            if value is not missing:
+                return value
+
+        try:
+            # Another process may have filled it while we took the lock
+            value = self.get(key, version, missing)
+            if value is missing:
+                value = fetch()
+                self.put(key, value, ttl, version)
+            return value
+        finally:
+            self._release(key)
+
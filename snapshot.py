@@ -0,0 +1,134 @@
+from datetime import datetime
+
+from forecast import forecast_attendance
+from occurrences import occurrence_index, occurrence_version
+from planning import budget
+from records import subject_id
+
+SNAPSHOT_TTL = 6 * 3600
+
+
+def classify_risk(current_pct, projected_pct, minimum_required=75):
+    if current_pct < minimum_required:
+        return "CRITICAL", "Your attendance is already below the minimum requirement."
+    if projected_pct < minimum_required:
+        return "HIGH", "You may fall below the minimum attendance if lectures are missed."
+    if current_pct < minimum_required + 5:
+        return "BORDERLINE", "You are close to the minimum attendance threshold."
+    return "SAFE", "Your attendance is safe."
+
+
+# ================== SNAPSHOT ==================
+
+class UserAttendanceSnapshot:
+    """
+    Everything the Insights tab and the bot show for one user, computed
+    from that user's materialized lecture calendar (see occurrences.py).
+    """
+
+    def __init__(self, user_id, as_of, minimum_required, stats, future_lectures,
+                 subjects, weekly, budget, forecast):
+        self.user_id = user_id
+        self.as_of = as_of
+        self.minimum_required = minimum_required
+        self.stats = stats                      # {"attendance_pct", "present", "total"}
+        self.future_lectures = future_lectures
+        self.subjects = subjects                # {subject: {"present", "total", "off"}}
+        self.weekly = weekly                    # [(week_start, pct)]
+        self.budget = budget                    # {"overall": {...}, "subjects": {...}}
+        self.forecast = forecast                # see forecast.forecast_attendance
+
+    @property
+    def risk(self):
+        present = self.stats["present"]
+        total = self.stats["total"]
+
+        if total == 0:
+            return {
+                "current_pct": 0,
+                "projected_pct": 0,
+                "future_lectures": 0,
+                "risk": "UNKNOWN",
+                "message": "Not enough attendance data yet."
+            }
+
+        projected_pct = round(
+            (present / (total + self.future_lectures)) * 100, 2
+        ) if (total + self.future_lectures) else 100
+        risk, message = classify_risk(
+            self.stats["attendance_pct"], projected_pct, self.minimum_required
+        )
+
+        return {
+            "current_pct": self.stats["attendance_pct"],
+            "projected_pct": projected_pct,
+            "future_lectures": self.future_lectures,
+            "risk": risk,
+            "message": message
+        }
+
+
+def build_snapshot(store, user_id, minimum_required=75, today=None):
+    today = today or datetime.now().date()
+    index = occurrence_index(store, user_id)
+    stats = index.stats(today)
+    future = index.future(today)
+    future_lectures = sum(future.values())
+
+    subjects = index.subjects(today)
+    names = list(subjects)
+    per_subject = budget(
+        [subjects[s]["present"] for s in names],
+        [subjects[s]["total"] for s in names],
+        [future.get(subject_id(s), 0) for s in names],
+        minimum_required,
+    )
+
+    return UserAttendanceSnapshot(
+        user_id=str(user_id),
+        as_of=today,
+        minimum_required=minimum_required,
+        stats=stats,
+        future_lectures=future_lectures,
+        subjects=subjects,
+        weekly=index.weekly(today),
+        budget={
+            "overall": budget(
+                stats["present"], stats["total"], future_lectures, minimum_required
+            ),
+            "subjects": {
+                name: {k: v[i].item() for k, v in per_subject.items()}
+                for i, name in enumerate(names)
+            },
+        },
+        forecast=forecast_attendance(index, today, minimum_required),
+    )
+
+
+def data_version(store, user_id, today):
+    """
+    Stamp of one user's inputs: the day, their Attendance rows (count and
+    last row id, plus the table's rewrite counter for edits and reloads)
+    and their occurrence calendar. Other users' marks leave it unchanged.
+    """
+    count, last_id = store.query(
+        "SELECT COUNT(*), MAX(rowid) FROM Attendance WHERE user_id = ?", [str(user_id)]
+    )[0]
+    return (
+        f"{today}:{count}:{last_id}:{store.version('Attendance:rewrite')}:"
+        f"{occurrence_version(store, user_id)}"
+    )
+
+
+def get_snapshot(store, user_id, minimum_required=75):
+    """
+    Memoized snapshot, shared across processes through the store's cache.
+    One entry per user; a change to their own data (or a new day) is a miss.
+    """
+    today = datetime.now().date()
+    return store.cache.get_or_fetch(
+        f"snapshot:{user_id}:{minimum_required}",
+        lambda: build_snapshot(store, user_id, minimum_required, today),
+        SNAPSHOT_TTL,
+        data_version(store, user_id, today),
+    )
@@ -0,0 +1,627 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+import occurrences
+import risk_batch
+from shared_cache import SharedCache
+from write_queue import MAX_BATCH_OPS, column_letter, flush
+
+DB_PATH = os.getenv("ATTENDSMART_DB", "attendsmart.db")
+
+REPLICATION_INTERVAL = 1        # seconds between outbox flushes
+REPLICATION_LEASE = 180         # seconds a replicator owns the outbox; renewed per
+                                # batch, so it must outlive one batch with quota retries
+SHEET_REFRESH_TTL = 300         # seconds between pulls of direct sheet edits
+REFRESH_INTERVAL = 60           # seconds between Refresher checks (the TTL gates pulls)
+FULL_SYNC_EVERY = 12            # tail syncs between full checksum resyncs
+
+# Worksheets that are only ever appended to; refreshed by fetching the new tail
+APPEND_ONLY = {"Attendance"}
+
+# ================== SCHEMA ==================
+
+# Column order matches the spreadsheet, so a local row maps 1:1 to a sheet row.
+TABLES = {
+    "Users": [
+        "user_id", "name", "email", "created_at"
+    ],
+    "Semester": [
+        "user_id", "semester_start", "semester_end", "updated_at"
+    ],
+    "Timetable": [
+        "user_id", "day", "subject", "start_time", "end_time"
+    ],
+    "User_Holidays": [
+        "user_id", "start_date", "end_date", "title", "category", "created_at"
+    ],
+    "National_Holidays": [
+        "date", "title"
+    ],
+    "Attendance": [
+        "user_id", "date", "day", "subject", "start_time", "end_time",
+        "status", "marked_at"
+    ],
+    "Notification_Settings": [
+        "user_id", "telegram", "email", "in_app", "telegram_chat_id",
+        "telegram_code", "email_id", "updated_at", "digest_minutes"
+    ],
+}
+
+INDEXES = {
+    "Users": [("email",), ("user_id",)],
+    "Semester": [("user_id",)],
+    "Timetable": [("user_id", "day")],
+    "User_Holidays": [("user_id", "start_date", "end_date")],
+    "National_Holidays": [("date",)],
+    "Attendance": [("user_id", "date", "subject", "start_time")],
+    "Notification_Settings": [("user_id",), ("telegram_code",)],
+}
+
+
+def sheet_rows(name, records):
+    """get_all_records() dicts -> value lists in TABLES column order"""
+    columns = TABLES[name]
+    rows = []
+    for rec in records:
+        positional = list(rec.values())
+        rows.append([
+            rec.get(col, positional[i] if i < len(positional) else "")
+            for i, col in enumerate(columns)
+        ])
+    return rows
+
+
+def rows_checksum(rows):
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(json.dumps([str(v) for v in row]).encode())
+    return digest.hexdigest()
+
+
+# ================== REPOSITORY ==================
+
+class Table:
+    """
+    Repository for one worksheet. Rows come back as dicts keyed by column
+    name plus `_id`, the local row id used for updates and deletes.
+    """
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.columns = TABLES[name]
+        self._select = (
+            f"SELECT rowid, {', '.join(self.columns)} FROM {name}"
+        )
+
+    def _to_dict(self, row):
+        record = dict(zip(self.columns, row[1:]))
+        record["_id"] = row[0]
+        return record
+
+    def _where(self, filters):
+        for col in filters:
+            if col not in self.columns:
+                raise KeyError(f"{self.name} has no column {col!r}")
+        clause = " AND ".join(f"{col} = ?" for col in filters)
+        return (f" WHERE {clause}" if clause else ""), list(filters.values())
+
+    def all(self):
+        return self.where()
+
+    def where(self, **filters):
+        clause, params = self._where(filters)
+        rows = self.store.query(f"{self._select}{clause} ORDER BY rowid", params)
+        return [self._to_dict(r) for r in rows]
+
+    def first(self, **filters):
+        clause, params = self._where(filters)
+        rows = self.store.query(
+            f"{self._select}{clause} ORDER BY rowid LIMIT 1", params
+        )
+        return self._to_dict(rows[0]) if rows else None
+
+    def count(self, **filters):
+        clause, params = self._where(filters)
+        return self.store.query(f"SELECT COUNT(*) FROM {self.name}{clause}", params)[0][0]
+
+    def get(self, row_id):
+        rows = self.store.query(f"{self._select} WHERE rowid = ?", [row_id])
+        return self._to_dict(rows[0]) if rows else None
+
+    def after(self, row_id):
+        """Rows appended after local row id `row_id`"""
+        rows = self.store.query(f"{self._select} WHERE rowid > ? ORDER BY rowid", [row_id])
+        return [self._to_dict(r) for r in rows]
+
+    def append(self, values):
+        """values: dict keyed by column, or a list in sheet column order"""
+        if isinstance(values, dict):
+            values = [values.get(col, "") for col in self.columns]
+
+        with self.store.transaction() as conn:
+            cur = conn.execute(
+                f"INSERT INTO {self.name} ({', '.join(self.columns)}) "
+                f"VALUES ({', '.join('?' for _ in self.columns)})",
+                values
+            )
+            self.store._enqueue(conn, self.name, "append", None, values)
+            self.store._bump_version(conn, self.name, rewrite=False)
+            return cur.lastrowid
+
+    def update(self, row_id, values):
+        """values: dict of the columns to change"""
+        with self.store.transaction() as conn:
+            assignments = ", ".join(f"{col} = ?" for col in values)
+            conn.execute(
+                f"UPDATE {self.name} SET {assignments} WHERE rowid = ?",
+                list(values.values()) + [row_id]
+            )
+            row = conn.execute(
+                f"{self._select} WHERE rowid = ?", [row_id]
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"{self.name} row {row_id} not found")
+            self.store._enqueue(
+                conn, self.name, "update", self._sheet_row(conn, row_id), list(row[1:])
+            )
+            self.store._bump_version(conn, self.name)
+
+    def delete(self, row_id):
+        with self.store.transaction() as conn:
+            sheet_row = self._sheet_row(conn, row_id)
+            conn.execute(f"DELETE FROM {self.name} WHERE rowid = ?", [row_id])
+            self.store._enqueue(conn, self.name, "delete", sheet_row, None)
+            self.store._bump_version(conn, self.name)
+
+    def _sheet_row(self, conn, row_id):
+        # Row 1 is the header; local rowid order mirrors sheet order.
+        position = conn.execute(
+            f"SELECT COUNT(*) FROM {self.name} WHERE rowid <= ?", [row_id]
+        ).fetchone()[0]
+        return position + 1
+
+
+# ================== LOCAL STORE ==================
+
+class LocalStore:
+    """SQLite primary store. Every write is mirrored to Sheets via the outbox."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        self.cache = SharedCache(path)
+        self._headers_checked = set()
+
+        self.users = Table(self, "Users")
+        self.semester = Table(self, "Semester")
+        self.timetable = Table(self, "Timetable")
+        self.user_holidays = Table(self, "User_Holidays")
+        self.national_holidays = Table(self, "National_Holidays")
+        self.attendance = Table(self, "Attendance")
+        self.notification_settings = Table(self, "Notification_Settings")
+
+    def table(self, name):
+        return Table(self, name)
+
+    def _create_schema(self):
+        with self.transaction() as conn:
+            for name, columns in TABLES.items():
+                cols = ", ".join(
+                    f"{c} INTEGER" if c == "user_id" else f"{c} TEXT"
+                    for c in columns
+                )
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({cols})")
+
+                # Columns added to the sheet later (appended at the end)
+                existing = {r[1] for r in conn.execute(f"PRAGMA table_info({name})")}
+                for c in columns:
+                    if c not in existing:
+                        conn.execute(f"ALTER TABLE {name} ADD COLUMN {c} TEXT DEFAULT ''")
+                for index_cols in INDEXES.get(name, []):
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS idx_{name}_{'_'.join(index_cols)} "
+                        f"ON {name} ({', '.join(index_cols)})"
+                    )
+
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS _outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, worksheet TEXT, op TEXT, "
+                "sheet_row INTEGER, payload TEXT, created_at REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS _leases ("
+                "name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS _meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS _versions ("
+                "worksheet TEXT PRIMARY KEY, version INTEGER)"
+            )
+            occurrences.install(conn)
+            risk_batch.install(conn)
+
+    # ---------- Low level ----------
+
+    def transaction(self):
+        return _Transaction(self)
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def get_meta(self, key, default=None):
+        rows = self.query("SELECT value FROM _meta WHERE key = ?", [key])
+        return rows[0][0] if rows else default
+
+    def set_meta(self, key, value):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO _meta (key, value) VALUES (?, ?)", [key, value]
+            )
+
+    # ---------- Versions ----------
+
+    def _bump_version(self, conn, worksheet, rewrite=True):
+        """
+        Every write bumps the worksheet's version. Anything but a plain
+        append also bumps "<worksheet>:rewrite", so readers that keep parsed
+        rows can tell when picking up just the new tail is enough.
+        """
+        names = [worksheet, f"{worksheet}:rewrite"] if rewrite else [worksheet]
+        conn.executemany(
+            "INSERT INTO _versions (worksheet, version) VALUES (?, 1) "
+            "ON CONFLICT(worksheet) DO UPDATE SET version = version + 1",
+            [[name] for name in names]
+        )
+
+    def version(self, worksheet):
+        """Monotonic change counter, shared by every process using the store."""
+        rows = self.query(
+            "SELECT version FROM _versions WHERE worksheet = ?", [worksheet]
+        )
+        return rows[0][0] if rows else 0
+
+    # ---------- Outbox ----------
+
+    def _enqueue(self, conn, worksheet, op, sheet_row, payload):
+        conn.execute(
+            "INSERT INTO _outbox (worksheet, op, sheet_row, payload, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [worksheet, op, sheet_row, json.dumps(payload), time.time()]
+        )
+
+    def pending_ops(self, limit=100):
+        rows = self.query(
+            "SELECT id, worksheet, op, sheet_row, payload FROM _outbox "
+            "ORDER BY id LIMIT ?", [limit]
+        )
+        return [
+            {
+                "id": r[0], "worksheet": r[1], "op": r[2],
+                "sheet_row": r[3], "payload": json.loads(r[4])
+            }
+            for r in rows
+        ]
+
+    def pending_count(self, worksheet=None):
+        if worksheet:
+            return self.query(
+                "SELECT COUNT(*) FROM _outbox WHERE worksheet = ?", [worksheet]
+            )[0][0]
+        return self.query("SELECT COUNT(*) FROM _outbox")[0][0]
+
+    def ack(self, op_ids):
+        with self.transaction() as conn:
+            conn.executemany("DELETE FROM _outbox WHERE id = ?", [[i] for i in op_ids])
+
+    # ---------- Leases ----------
+
+    def acquire_lease(self, name, owner, ttl):
+        """Take or renew a named lease. Returns True if `owner` holds it."""
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO _leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                [name, owner, now + ttl]
+            )
+            cur = conn.execute(
+                "UPDATE _leases SET owner = ?, expires_at = ? "
+                "WHERE name = ? AND (owner = ? OR expires_at < ?)",
+                [owner, now + ttl, name, owner, now]
+            )
+            return cur.rowcount == 1
+
+    def renew_lease(self, name, owner, ttl):
+        """
+        Extend a lease `owner` still holds, even if it lapsed unclaimed.
+        Unlike acquire_lease, never takes it back once another owner has.
+        """
+        with self.transaction() as conn:
+            cur = conn.execute(
+                "UPDATE _leases SET expires_at = ? WHERE name = ? AND owner = ?",
+                [time.time() + ttl, name, owner]
+            )
+            return cur.rowcount == 1
+
+    def release_lease(self, name, owner):
+        with self.transaction() as conn:
+            conn.execute(
+                "DELETE FROM _leases WHERE name = ? AND owner = ?", [name, owner]
+            )
+
+    # ---------- Sheets sync ----------
+
+    def table_checksum(self, name):
+        rows = self.query(
+            f"SELECT {', '.join(TABLES[name])} FROM {name} ORDER BY rowid"
+        )
+        return rows_checksum(rows)
+
+    def load_rows(self, name, records):
+        """
+        Replace a local table with rows pulled from the sheet (no outbox).
+        Returns False, leaving row ids untouched, when nothing changed or
+        when local writes are waiting to be replicated.
+        """
+        columns = TABLES[name]
+        rows = sheet_rows(name, records)
+
+        if rows_checksum(rows) == self.table_checksum(name):
+            return False
+
+        with self.transaction() as conn:
+            # A write may have landed while the sheet was being fetched;
+            # the fetched rows don't have it yet, so keep the local table
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM _outbox WHERE worksheet = ?", [name]
+            ).fetchone()[0]
+            if pending:
+                return False
+            conn.execute(f"DELETE FROM {name}")
+            conn.executemany(
+                f"INSERT INTO {name} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                rows
+            )
+            self._bump_version(conn, name)
+        return True
+
+    def ensure_header(self, spreadsheet, name):
+        """
+        Write the header cells of columns appended to TABLES after the
+        worksheet was created; without them get_all_records() drops the
+        column and the next sync blanks it locally. Checked once per
+        worksheet per process.
+        """
+        if name in self._headers_checked:
+            return
+        columns = TABLES[name]
+        ws = spreadsheet.worksheet(name)
+        header = ws.row_values(1)
+        missing = columns[len(header):]
+        if missing and header == columns[:len(header)]:
+            ws.update(
+                range_name=f"{column_letter(len(header) + 1)}1", values=[missing]
+            )
+            metrics.log("sheet_header_added", worksheet=name, columns=missing)
+        elif header[:len(columns)] != columns:
+            metrics.log(
+                "sheet_header_mismatch", level="warning", worksheet=name, header=header
+            )
+        self._headers_checked.add(name)
+
+    def sync_from_sheets(self, spreadsheet, names=None):
+        """
+        Pull worksheets into the local store. Tables with unreplicated
+        writes are skipped so local changes are never lost.
+        """
+        synced = []
+        for name in names or TABLES:
+            if self.pending_count(name):
+                continue
+            self.ensure_header(spreadsheet, name)
+            with metrics.SHEET_FETCH_SECONDS.time(worksheet=name, mode="full"):
+                records = spreadsheet.worksheet(name).get_all_records()
+            metrics.SHEET_ROWS.set(len(records), worksheet=name, mode="full")
+            if self.load_rows(name, records):
+                synced.append(name)
+        return synced
+
+    def tail_sync(self, spreadsheet, name):
+        """
+        Delta sync for an append-only worksheet: fetch only rows past the
+        local row count, re-reading the last known row as a checksum.
+        Falls back to a full sync when that row no longer matches (edits or
+        deletes happened) and every FULL_SYNC_EVERY calls regardless.
+        Returns the number of new rows, or None after a full sync.
+        """
+        if self.pending_count(name):
+            return 0
+
+        columns = TABLES[name]
+        local_rows = self.query(f"SELECT COUNT(*) FROM {name}")[0][0]
+        tail_syncs = int(self.get_meta(f"tail_syncs:{name}", 0))
+
+        if local_rows == 0 or tail_syncs >= FULL_SYNC_EVERY:
+            self.set_meta(f"tail_syncs:{name}", "0")
+            self.sync_from_sheets(spreadsheet, [name])
+            return None
+
+        # Sheet row n+1 holds local row n (row 1 is the header)
+        with metrics.SHEET_FETCH_SECONDS.time(worksheet=name, mode="tail"):
+            values = spreadsheet.worksheet(name).get(
+                f"A{local_rows + 1}:{column_letter(len(columns))}"
+            )
+        metrics.SHEET_ROWS.set(len(values), worksheet=name, mode="tail")
+        rows = [list(v) + [""] * (len(columns) - len(v)) for v in values]
+
+        last_local = self.query(
+            f"SELECT {', '.join(columns)} FROM {name} ORDER BY rowid DESC LIMIT 1"
+        )
+        if not rows or rows_checksum(rows[:1]) != rows_checksum(last_local):
+            self.set_meta(f"tail_syncs:{name}", "0")
+            self.sync_from_sheets(spreadsheet, [name])
+            return None
+
+        new_rows = rows[1:]
+        if new_rows:
+            with self.transaction() as conn:
+                conn.executemany(
+                    f"INSERT INTO {name} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' for _ in columns)})",
+                    new_rows
+                )
+                self._bump_version(conn, name, rewrite=False)
+
+        self.set_meta(f"tail_syncs:{name}", str(tail_syncs + 1))
+        return len(new_rows)
+
+    def refresh_from_sheets(self, spreadsheet, names=None, ttl=SHEET_REFRESH_TTL):
+        """
+        Pick up edits made directly in the spreadsheet. The shared cache
+        makes this one fetch per worksheet per TTL for the whole host,
+        whichever process (app, notifier, bot) gets there first.
+        """
+        for name in names or TABLES:
+            if name in APPEND_ONLY:
+                fetch = lambda name=name: self.tail_sync(spreadsheet, name)
+            else:
+                fetch = lambda name=name: self.sync_from_sheets(spreadsheet, [name])
+            self.cache.get_or_fetch(f"sheet:{name}", fetch, ttl)
+
+    def bootstrap(self, spreadsheet):
+        if self.get_meta("bootstrapped_at"):
+            return
+        self.sync_from_sheets(spreadsheet)
+        self.set_meta("bootstrapped_at", str(time.time()))
+
+
+class _Transaction:
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        self.store._lock.acquire()
+        self.store.conn.execute("BEGIN IMMEDIATE")
+        return self.store.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.store.conn.execute("COMMIT")
+            else:
+                self.store.conn.execute("ROLLBACK")
+        finally:
+            self.store._lock.release()
+        return False
+
+
+# ================== SHEETS REPLICATOR ==================
+
+class Replicator(threading.Thread):
+    """
+    Background thread that pushes outbox operations to the spreadsheet in
+    order, batched by write_queue. Only the process holding the "replicator"
+    lease drains, so sheet row numbers stay consistent when several
+    processes share the store.
+    """
+
+    def __init__(self, store, spreadsheet, interval=REPLICATION_INTERVAL):
+        super().__init__(daemon=True, name="sheets-replicator")
+        self.store = store
+        self.spreadsheet = spreadsheet
+        self.interval = interval
+        self.owner = uuid.uuid4().hex
+        self._stop_event = threading.Event()
+        self._drain_lock = threading.Lock()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                metrics.log("replication_failed", level="error", error=repr(e))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def drain(self, limit=MAX_BATCH_OPS):
+        if not self.store.acquire_lease("replicator", self.owner, REPLICATION_LEASE):
+            return 0
+
+        with self._drain_lock:
+            ops = self.store.pending_ops(limit)
+            if not ops:
+                return 0
+            # Renewed before each batch: once another process has taken
+            # over, these ops may already be applied and must not be again
+            return flush(
+                self.spreadsheet, ops, self.store.ack,
+                renew=lambda: self.store.renew_lease(
+                    "replicator", self.owner, REPLICATION_LEASE
+                )
+            )
+
+    def flush(self):
+        """Drain until the outbox is empty (used on shutdown)."""
+        self.stop()
+        try:
+            while self.drain():
+                pass
+        except Exception as e:
+            metrics.log("replication_flush_failed", level="error", error=repr(e))
+        finally:
+            self.store.release_lease("replicator", self.owner)
+
+
+class Refresher(threading.Thread):
+    """
+    Background thread that runs refresh_from_sheets every `interval`
+    seconds, so a long-running loop never waits on a full worksheet pull
+    (the Timetable alone is ~24 rows per user).
+    """
+
+    def __init__(self, store, spreadsheet, interval=REFRESH_INTERVAL):
+        super().__init__(daemon=True, name="sheets-refresher")
+        self.store = store
+        self.spreadsheet = spreadsheet
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.store.refresh_from_sheets(self.spreadsheet)
+            except Exception as e:
+                metrics.log("refresh_failed", level="error", error=repr(e))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def open_store(spreadsheet, path=DB_PATH, replicate=True):
+    store = LocalStore(path)
+    store.bootstrap(spreadsheet)
+    if replicate:
+        store.replicator = Replicator(store, spreadsheet)
+        store.replicator.start()
+        atexit.register(store.replicator.flush)
+    return store
@@ -4,6 +4,10 @@ from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
 from dotenv import load_dotenv
 import gspread
 from google.oauth2.service_account import Credentials
+import metrics
+from storage import open_store
+from quota_client import QuotaClient
+from snapshot import get_snapshot
 
 
 load_dotenv()
@@ -22,13 +26,17 @@ creds = Credentials.from_service_account_file(
     scopes=SCOPES
 )
 
-gc = gspread.authorize(creds)
+gc = QuotaClient(gspread.authorize(creds))
 
 SPREADSHEET_ID = "1wGnF_bV3pNMx2l3BtwXEfKFdbs3ToYsgxqqgnKBAqgU"
 
+spreadsheet = gc.open_by_key(SPREADSHEET_ID)
+store = open_store(spreadsheet)
+
 
 # /start command
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    metrics.BOT_COMMANDS.inc(command="start", outcome="ok")
     await update.message.reply_text(
         "👋 Hi! I am AttendSmart Bot.\n\n"
         "I’ll send you lecture reminders and notifications.\n\n"
@@ -38,27 +46,28 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # /link command
 async def link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
+        metrics.BOT_COMMANDS.inc(command="link", outcome="missing_code")
         await update.message.reply_text("❌ Please send:\n/link AS-1234")
         return
 
     link_code = context.args[0]
     chat_id = update.effective_chat.id
 
-    sheet = gc.open_by_key(SPREADSHEET_ID)
-    ws = sheet.worksheet("Notification_Settings")
-
-    rows = ws.get_all_records()
-    headers = ws.row_values(1)
+    store.refresh_from_sheets(spreadsheet, ["Notification_Settings"])
+    row = store.notification_settings.first(telegram_code=link_code)
 
     matched = False
 
-    for idx, row in enumerate(rows, start=2):
-        if row.get("telegram_code") == link_code:
-            ws.update_cell(idx, headers.index("telegram_chat_id") + 1, str(chat_id))
-            ws.update_cell(idx, headers.index("telegram") + 1, "yes")
-            ws.update_cell(idx, headers.index("telegram_code") + 1, "")
-            matched = True
-            break
+    if row:
+        store.notification_settings.update(row["_id"], {
+            "telegram_chat_id": str(chat_id),
+            "telegram": "yes",
+            "telegram_code": ""
+        })
+        matched = True
+
+    metrics.BOT_COMMANDS.inc(command="link", outcome="linked" if matched else "invalid")
+    metrics.log("telegram_link", chat_id=chat_id, matched=matched)
 
     if matched:
         await update.message.reply_text(
@@ -71,6 +80,50 @@ async def link(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 
+# /stats command
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = str(update.effective_chat.id)
+    row = store.notification_settings.first(telegram_chat_id=chat_id)
+
+    if not row:
+        metrics.BOT_COMMANDS.inc(command="stats", outcome="unlinked")
+        await update.message.reply_text(
+            "❌ This chat isn't linked yet.\nUse /link with the code from the app."
+        )
+        return
+
+    try:
+        snapshot = get_snapshot(store, row["user_id"])
+    except ValueError:
+        metrics.BOT_COMMANDS.inc(command="stats", outcome="no_semester")
+        await update.message.reply_text("📌 Set your semester dates in the app first.")
+        return
+
+    metrics.BOT_COMMANDS.inc(command="stats", outcome="ok")
+    if snapshot.stats["total"] == 0:
+        await update.message.reply_text("📌 No attendance data available yet.")
+        return
+
+    risk = snapshot.risk
+    overall = snapshot.budget["overall"]
+    lines = [
+        f"📊 Attendance: {snapshot.stats['attendance_pct']}% "
+        f"({snapshot.stats['present']} / {snapshot.stats['total']})",
+        f"⚠️ Risk: {risk['risk']} — {risk['message']}",
+    ]
+    if overall["skippable"] > 0:
+        lines.append(f"🧮 You can skip {overall['skippable']} more lectures.")
+    elif overall["reachable"]:
+        lines.append(f"🧮 Attend the next {overall['must_attend']} lectures to reach 75%.")
+    lines.append("")
+    for subject, data in snapshot.subjects.items():
+        if data["total"]:
+            lines.append(f"📘 {subject}: {round(data['present'] / data['total'] * 100, 2)}%")
+
+    await update.message.reply_text("\n".join(lines).strip())
+
+
+
 # def run_bot():
 #     app = ApplicationBuilder().token(BOT_TOKEN).build()
 #     app.add_handler(CommandHandler("start", start))
@@ -85,6 +138,8 @@ def run_bot():
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("link", link)) 
+    app.add_handler(CommandHandler("stats", stats))
 
+    metrics.serve(metrics.BOT_PORT_OFFSET)
     print("🤖 Telegram bot running...")
     app.run_polling()
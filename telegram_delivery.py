@@ -0,0 +1,207 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+import httpx
+
+import metrics
+from rate_limit import TokenBucket
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+GLOBAL_PER_SECOND = 30          # Telegram: ~30 messages/second per bot
+PER_CHAT_PER_SECOND = 1         # Telegram: ~1 message/second per chat
+MAX_CONCURRENCY = 10
+MAX_ATTEMPTS = 4
+REQUEST_TIMEOUT = 10
+MAX_QUEUE = 10000
+
+
+class TelegramDelivery:
+    """
+    Background asyncio worker that delivers Telegram messages over one
+    keep-alive HTTP connection pool.
+
+    - bounded concurrency (MAX_CONCURRENCY in-flight requests)
+    - global and per-chat token buckets
+    - honours `retry_after` on 429, backs off on 5xx / network errors
+    - records latency and outcome per message (`results`, `on_result`);
+      an optional `tag` passed to send() comes back in the result
+
+    `send()` is thread-safe and never blocks on the network.
+    """
+
+    def __init__(self, token, base_url=TELEGRAM_API_URL, concurrency=MAX_CONCURRENCY,
+                 global_rate=GLOBAL_PER_SECOND, chat_rate=PER_CHAT_PER_SECOND,
+                 on_result=None):
+        self.url = f"{base_url.rstrip('/')}/bot{token}/sendMessage"
+        self.concurrency = concurrency
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self.on_result = on_result
+        self.results = deque(maxlen=1000)
+
+        self._pending = 0
+        self._handoff = deque()         # sent, not yet on the loop's queue
+        self._waking = False
+        self._idle = threading.Condition()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="telegram-delivery")
+        self._thread.start()
+        self._ready.wait()
+
+    # ---------- Public API ----------
+
+    def send(self, chat_id, text, parse_mode="Markdown", tag=None):
+        payload = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+
+        with self._idle:
+            if self._pending >= MAX_QUEUE:
+                self._record(chat_id, False, None, 0.0, 0, "queue full", tag)
+                return False
+            self._pending += 1
+            self._handoff.append((payload, tag))
+            # One loop wake-up per burst of sends rather than per message
+            wake, self._waking = not self._waking, True
+        if wake:
+            self._loop.call_soon_threadsafe(self._take_handoff)
+        return True
+
+    def flush(self, timeout=None):
+        """Block until every queued message has been attempted."""
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._idle:
+            while self._pending:
+                remaining = deadline - time.monotonic() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(timeout)
+
+    # ---------- Worker ----------
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._main())
+        self._loop.close()
+
+    async def _main(self):
+        self._queue = asyncio.Queue()
+        self._stop = asyncio.Event()
+        limits = httpx.Limits(
+            max_connections=self.concurrency, max_keepalive_connections=self.concurrency
+        )
+        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=limits) as client:
+            workers = [
+                asyncio.create_task(self._worker(client)) for _ in range(self.concurrency)
+            ]
+            self._ready.set()
+            await self._stop.wait()
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def _take_handoff(self):
+        with self._idle:
+            items = list(self._handoff)
+            self._handoff.clear()
+            self._waking = False
+        for item in items:
+            self._queue.put_nowait(item)
+
+    async def _worker(self, client):
+        while True:
+            payload, tag = await self._queue.get()
+            try:
+                await self._deliver(client, payload, tag)
+            finally:
+                with self._idle:
+                    self._pending -= 1
+                    self._idle.notify_all()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > MAX_QUEUE:
+                self.chat_buckets.clear()
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        return bucket
+
+    async def _deliver(self, client, payload, tag=None):
+        chat_id = payload["chat_id"]
+        started = time.monotonic()
+        status = None
+        error = None
+
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            wait = max(self._chat_bucket(chat_id).reserve(), self.global_bucket.reserve())
+            if wait:
+                await asyncio.sleep(wait)
+
+            try:
+                response = await client.post(self.url, json=payload)
+            except httpx.HTTPError as e:
+                status, error = None, str(e)
+                await asyncio.sleep(min(2 ** attempt, 30))
+                continue
+
+            status = response.status_code
+            if status == 200:
+                self._record(
+                    chat_id, True, status, time.monotonic() - started, attempt, None, tag
+                )
+                return
+
+            error = response.text[:200]
+            if status == 429:
+                await asyncio.sleep(retry_after(response))
+            elif status >= 500:
+                await asyncio.sleep(min(2 ** attempt, 30))
+            else:
+                break       # 4xx other than 429 won't succeed on retry
+
+        self._record(chat_id, False, status, time.monotonic() - started, attempt, error, tag)
+        metrics.log(
+            "telegram_failed", level="error",
+            chat_id=chat_id, status=status, attempts=attempt, error=error
+        )
+
+    def _record(self, chat_id, ok, status, latency, attempts, error, tag=None):
+        result = {
+            "chat_id": chat_id,
+            "ok": ok,
+            "status": status,
+            "latency": latency,
+            "attempts": attempts,
+            "error": error,
+            "tag": tag,
+        }
+        self.results.append(result)
+        outcome = "ok" if ok else "failed"
+        metrics.TELEGRAM_MESSAGES.inc(outcome=outcome, status=status)
+        metrics.TELEGRAM_SECONDS.observe(latency, outcome=outcome)
+        if self.on_result:
+            self.on_result(result)
+
+
+def retry_after(response, default=1):
+    """Seconds to wait from a 429 body (`parameters.retry_after`) or header."""
+    try:
+        return float(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        pass
+    try:
+        return float(response.headers.get("Retry-After", default))
+    except ValueError:
+        return default
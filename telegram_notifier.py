@@ -1,6 +1,6 @@
-import requests
 from datetime import datetime, timedelta
 from google_sheets import open_spreadsheet
+from telegram_delivery import TelegramDelivery
 import os
 from dotenv import load_dotenv
 
@@ -15,12 +15,10 @@ SPREADSHEET_ID = "1wGnF_bV3pNMx2l3BtwXEfKFdbs3ToYsgxqqgnKBAqgU"
 # timings
 ATTENDANCE_REMINDER_MINUTES = 5
 
+telegram = TelegramDelivery(BOT_TOKEN)
+
 def send_telegram(chat_id, message):
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    requests.post(url, json={
-        "chat_id": chat_id,
-        "text": message
-    })
+    telegram.send(chat_id, message, parse_mode=None)
 
 def attendance_reminders(sheet):
     now = datetime.now()
@@ -64,4 +62,5 @@ if __name__ == "__main__":
     sheet = open_spreadsheet(SPREADSHEET_ID)
 
     attendance_reminders(sheet)
+    telegram.close()
 
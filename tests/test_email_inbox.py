@@ -0,0 +1,225 @@
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+
+import pytest
+
+import email_delivery
+from email_delivery import EmailDelivery
+from inbox import Inbox
+from storage import LocalStore
+
+
+class StubSMTP:
+    """
+    Minimal local SMTP server. Counts sessions, keeps delivered messages,
+    refuses recipients listed in `refuse` and, with `drop_after`, hangs up
+    after that many messages in a session.
+    """
+
+    def __init__(self, refuse=(), drop_after=None):
+        self.refuse = set(refuse)
+        self.drop_after = drop_after
+        self.sessions = 0
+        self.messages = []
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                stub.sessions += 1
+                delivered = 0
+                self.reply("220 stub ESMTP")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode().strip()
+                    verb = command.split(" ", 1)[0].upper()
+
+                    if verb in ("EHLO", "HELO"):
+                        self.reply("250 stub")
+                    elif verb == "MAIL":
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        address = command.split(":", 1)[1].strip("<> ")
+                        self.reply("550 no such user" if address in stub.refuse else "250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 go ahead")
+                        data = b""
+                        while True:
+                            chunk = self.rfile.readline()
+                            if chunk in (b".\r\n", b""):
+                                break
+                            data += chunk
+                        stub.messages.append(message_from_bytes(data))
+                        delivered += 1
+                        self.reply("250 queued")
+                        if stub.drop_after and delivered >= stub.drop_after:
+                            return
+                    elif verb == "QUIT":
+                        self.reply("221 bye")
+                        return
+                    else:
+                        self.reply("250 OK")
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def smtp():
+    server = StubSMTP()
+    yield server
+    server.close()
+
+
+def mailer(server, **kwargs):
+    return EmailDelivery(host="127.0.0.1", port=server.port, user="", **kwargs)
+
+
+# ================== EMAIL ==================
+
+def test_flush_sends_batch_over_one_session(smtp):
+    email = mailer(smtp)
+    for i in range(3):
+        email.send(f"user{i}@example.com", f"Subject {i}", f"Body {i}")
+
+    assert email.flush() == (3, 0)
+    email.close()
+
+    assert smtp.sessions == 1
+    assert [m["To"] for m in smtp.messages] == [f"user{i}@example.com" for i in range(3)]
+    assert smtp.messages[0]["Subject"] == "Subject 0"
+
+
+def test_session_is_reused_across_flushes(smtp):
+    email = mailer(smtp)
+    email.send("a@example.com", "s", "b")
+    email.flush()
+    email.send("b@example.com", "s", "b")
+    email.flush()
+    email.close()
+
+    assert smtp.sessions == 1
+    assert len(smtp.messages) == 2
+
+
+def test_reconnects_after_max_batch(smtp, monkeypatch):
+    monkeypatch.setattr(email_delivery, "MAX_BATCH", 2)
+    email = mailer(smtp)
+    for i in range(5):
+        email.send(f"user{i}@example.com", "s", "b")
+
+    assert email.flush() == (5, 0)
+    email.close()
+
+    assert smtp.sessions == 3
+
+
+def test_reconnects_when_idle(smtp, monkeypatch):
+    monkeypatch.setattr(email_delivery, "SMTP_IDLE_SECONDS", 0)
+    email = mailer(smtp)
+    email.send("a@example.com", "s", "b")
+    email.flush()
+    time.sleep(0.01)
+    email.send("b@example.com", "s", "b")
+    email.flush()
+    email.close()
+
+    assert smtp.sessions == 2
+
+
+def test_retries_on_fresh_connection_when_server_hangs_up():
+    server = StubSMTP(drop_after=1)
+    try:
+        email = mailer(server)
+        for i in range(3):
+            email.send(f"user{i}@example.com", "s", "b")
+
+        assert email.flush() == (3, 0)
+        email.close()
+
+        assert len(server.messages) == 3
+        assert server.sessions >= 3
+    finally:
+        server.close()
+
+
+def test_refused_recipient_is_reported_with_tag():
+    server = StubSMTP(refuse={"bad@example.com"})
+    results = []
+    try:
+        email = mailer(server, on_result=results.append)
+        email.send("good@example.com", "s", "b", tag="attendance")
+        email.send("bad@example.com", "s", "b", tag="attendance")
+
+        assert email.flush() == (1, 1)
+        email.close()
+    finally:
+        server.close()
+
+    assert results == [
+        {"to": "good@example.com", "ok": True, "tag": "attendance"},
+        {"to": "bad@example.com", "ok": False, "tag": "attendance"},
+    ]
+
+
+def test_unreachable_server_fails_without_raising(smtp):
+    port = smtp.port
+    smtp.close()
+    email = EmailDelivery(host="127.0.0.1", port=port, user="")
+    email.send("a@example.com", "s", "b")
+
+    assert email.flush() == (0, 1)
+
+
+# ================== INBOX ==================
+
+@pytest.fixture
+def inbox(tmp_path):
+    return Inbox(LocalStore(str(tmp_path / "inbox.db")))
+
+
+def test_inbox_lists_newest_first_with_limit(inbox):
+    inbox.post_many([(1, "attendance", f"title {i}", f"body {i}") for i in range(3)])
+    inbox.post(1, "timetable", "latest", "body")
+    inbox.post(2, "attendance", "other user", "body")
+
+    messages = inbox.for_user(1, limit=2)
+
+    assert [m["title"] for m in messages] == ["latest", "title 2"]
+    assert all(not m["read"] for m in messages)
+    assert len(inbox.for_user("1")) == 4
+
+
+def test_inbox_unread_count_and_mark_read(inbox):
+    inbox.post_many([(1, "attendance", "a", "b"), (1, "attendance", "c", "d")])
+    inbox.post(2, "attendance", "e", "f")
+
+    assert inbox.unread_count(1) == 2
+    inbox.mark_read(1)
+
+    assert inbox.unread_count(1) == 0
+    assert inbox.unread_count(2) == 1
+    assert all(m["read"] for m in inbox.for_user(1))
+
+
+def test_inbox_prune_keeps_unread(inbox):
+    inbox.post(1, "attendance", "read", "b")
+    inbox.mark_read(1)
+    inbox.post(1, "attendance", "unread", "b")
+
+    inbox.prune(retention=-1)
+
+    assert [m["title"] for m in inbox.for_user(1)] == ["unread"]
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import telegram_delivery
+from telegram_delivery import TelegramDelivery
+
+
+class StubTelegram:
+    """
+    Local stand-in for the Bot API. `script` is a list of (status, body)
+    replies handed out in order; once it runs out every request gets 200.
+    """
+
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.requests = []          # (arrival time, payload)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests.append((time.monotonic(), payload))
+                    status, body = stub.script.pop(0) if stub.script else (200, {"ok": True})
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubTelegram()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record backoff sleeps instead of waiting them out."""
+    recorded = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        recorded.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(telegram_delivery.asyncio, "sleep", fake_sleep)
+    return recorded
+
+
+def deliver(stub, messages, **kwargs):
+    telegram = TelegramDelivery("TOKEN", base_url=stub.url, **kwargs)
+    try:
+        for chat_id, text in messages:
+            telegram.send(chat_id, text, tag="test")
+        assert telegram.flush(timeout=10)
+    finally:
+        telegram.close()
+    return list(telegram.results)
+
+
+def test_delivers_to_send_message(stub):
+    results = deliver(stub, [(1, "hello")])
+
+    assert [r["ok"] for r in results] == [True]
+    assert results[0]["tag"] == "test"
+    assert stub.requests[0][1] == {"chat_id": 1, "text": "hello", "parse_mode": "Markdown"}
+
+
+def test_429_waits_retry_after_then_retries(stub, sleeps):
+    stub.script = [(429, {"ok": False, "parameters": {"retry_after": 7}})]
+
+    results = deliver(stub, [(1, "hello")])
+
+    assert results[0]["ok"] and results[0]["attempts"] == 2
+    assert 7 in sleeps
+    assert len(stub.requests) == 2
+
+
+def test_429_falls_back_to_retry_after_header():
+    class Response:
+        headers = {"Retry-After": "3"}
+
+        def json(self):
+            raise ValueError
+
+    assert telegram_delivery.retry_after(Response()) == 3.0
+
+
+def test_5xx_backs_off_exponentially(stub, sleeps):
+    stub.script = [(502, {"ok": False}), (503, {"ok": False})]
+
+    results = deliver(stub, [(1, "hello")])
+
+    assert results[0]["ok"] and results[0]["attempts"] == 3
+    # Backoff sleeps are exact powers of two; the per-chat bucket adds its own waits
+    assert [s for s in sleeps if s in (2, 4)] == [2, 4]
+
+
+def test_gives_up_after_max_attempts(stub, sleeps):
+    stub.script = [(500, {"ok": False})] * telegram_delivery.MAX_ATTEMPTS
+
+    results = deliver(stub, [(1, "hello")])
+
+    assert not results[0]["ok"]
+    assert results[0]["attempts"] == telegram_delivery.MAX_ATTEMPTS
+    assert results[0]["status"] == 500
+
+
+def test_other_4xx_is_not_retried(stub, sleeps):
+    stub.script = [(400, {"ok": False, "description": "chat not found"})]
+
+    results = deliver(stub, [(1, "hello")])
+
+    assert not results[0]["ok"] and results[0]["attempts"] == 1
+    assert len(stub.requests) == 1
+
+
+def test_per_chat_bucket_spaces_one_chat_only(stub):
+    # 10 messages/second per chat: three to chat 1 take at least 0.2 s,
+    # while chat 2 is not held up behind them.
+    deliver(stub, [(1, "a"), (1, "b"), (1, "c"), (2, "d")], chat_rate=10)
+
+    chat1 = [t for t, p in stub.requests if p["chat_id"] == 1]
+    chat2 = [t for t, p in stub.requests if p["chat_id"] == 2]
+
+    assert len(chat1) == 3
+    assert chat1[-1] - chat1[0] >= 0.18
+    assert chat2[0] < chat1[-1]
+
+
+def test_queue_full_is_reported_as_failure(stub, monkeypatch):
+    monkeypatch.setattr(telegram_delivery, "MAX_QUEUE", 0)
+    telegram = TelegramDelivery("TOKEN", base_url=stub.url)
+    try:
+        assert telegram.send(1, "hello", tag="test") is False
+    finally:
+        telegram.close()
+
+    assert telegram.results[0]["ok"] is False
+    assert telegram.results[0]["error"] == "queue full"
@@ -0,0 +1,94 @@
+from datetime import datetime
+
+import numpy as np
+
+from calendar_engine import day_array, to_day
+from occurrences import occurrence_index
+from records import Status, format_minutes, parse_minutes, subject_id, subject_name
+
+# "If I skip these, where do I end up?" answered from a user's occurrence
+# index (occurrences.py) without writing anything. Lectures not skipped are
+# assumed attended, so every figure is the best case around the plan.
+# Skipped lectures count as absences, or drop out of the count altogether
+# with leave=True, exactly as a User_Holidays row would.
+
+
+def skipped_mask(index, today, dates=(), lectures=()):
+    """
+    Upcoming occurrences hit by the plan.
+    dates: whole days off; lectures: (date, subject) or (date, subject, start_time)
+    """
+    mask = np.zeros(len(index), dtype=bool)
+    if len(dates):
+        mask |= np.isin(index.day, day_array(dates))
+
+    for lecture in lectures:
+        hit = (index.day == to_day(lecture[0])) & (index.subject == subject_id(lecture[1]))
+        if len(lecture) > 2:
+            hit &= index.start == parse_minutes(lecture[2])
+        mask |= hit
+
+    return mask & index.upcoming(today)
+
+
+def _pct(present, counted):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counted > 0, np.round(present * 100 / np.maximum(counted, 1), 2), 0.0)
+
+
+def what_if(index, today, dates=(), lectures=(), leave=False):
+    """
+    Overall and per-subject percentages with and without the plan:
+    now, right after the last skipped day, and at semester end.
+    """
+    held = index.held(today)
+    attended = held & (index.status == Status.YES)
+    upcoming = index.upcoming(today)
+    skipped = skipped_mask(index, today, dates, lectures)
+
+    kept = upcoming & ~skipped
+    counted_future = kept if leave else upcoming
+    last = index.day[skipped].max() if skipped.any() else to_day(today)
+    until_last = index.day <= last
+
+    def figures(mask):
+        present = attended[mask].sum()
+        counted = held[mask].sum()
+        return {
+            "now": float(_pct(present, counted)),
+            "after": float(_pct(
+                present + (kept & until_last)[mask].sum(),
+                counted + (counted_future & until_last)[mask].sum(),
+            )),
+            "end": float(_pct(present + kept[mask].sum(), counted + counted_future[mask].sum())),
+            "baseline_end": float(_pct(present + upcoming[mask].sum(), counted + upcoming[mask].sum())),
+            "skipped": int(skipped[mask].sum()),
+        }
+
+    overall = figures(np.ones(len(index), dtype=bool))
+    subjects = {
+        subject_name(s): figures(index.subject == s)
+        for s in sorted(set(index.subject[skipped].tolist()), key=subject_name)
+    }
+
+    return {
+        "skipped": overall["skipped"],
+        "after_date": str(last) if skipped.any() else None,
+        "overall": overall,
+        "subjects": subjects,
+    }
+
+
+def upcoming_lectures(index, today, days=28):
+    """[(date, subject, start_time)] scheduled in the next `days` days"""
+    window = index.upcoming(today) & (index.day <= to_day(today) + days)
+    return [
+        (d.item(), subject_name(s), format_minutes(int(m)))
+        for d, s, m in zip(index.day[window], index.subject[window], index.start[window])
+    ]
+
+
+def plan_absence(store, user_id, dates=(), lectures=(), leave=False, today=None):
+    """what_if for a user, loading their occurrence index from the store"""
+    today = today or datetime.now().date()
+    return what_if(occurrence_index(store, user_id), today, dates, lectures, leave)
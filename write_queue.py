@@ -0,0 +1,98 @@
+# Write-behind batching for the Sheets mirror.
+#
+# Pending outbox operations are grouped per worksheet, in order, and each run
+# of consecutive appends or updates becomes one `append_rows` / `batch_update`
+# call. Deletes shift row numbers, so they always end a run.
+
+MAX_BATCH_OPS = 500         # outbox rows held in memory per flush
+
+
+def column_letter(n):
+    """1 -> A, 27 -> AA"""
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def row_range(row, width):
+    return f"A{row}:{column_letter(width)}{row}"
+
+
+# ================== COALESCING ==================
+
+def coalesce(ops):
+    """
+    ops: outbox entries ordered by id
+    Returns batches as dicts: {"worksheet", "op", "ops"}, ordered so that
+    each worksheet's operations are applied in their original order.
+    """
+    by_sheet = {}
+    for op in ops:
+        by_sheet.setdefault(op["worksheet"], []).append(op)
+
+    batches = []
+    for worksheet, sheet_ops in by_sheet.items():
+        current = None
+        for op in sheet_ops:
+            if current and current["op"] == op["op"] and op["op"] != "delete":
+                current["ops"].append(op)
+                continue
+            current = {"worksheet": worksheet, "op": op["op"], "ops": [op]}
+            batches.append(current)
+
+    return batches
+
+
+def apply_batch(spreadsheet, batch):
+    ws = spreadsheet.worksheet(batch["worksheet"])
+    ops = batch["ops"]
+
+    if batch["op"] == "append":
+        ws.append_rows([op["payload"] for op in ops])
+
+    elif batch["op"] == "update":
+        # Several edits to one row collapse to the latest full-row value
+        latest = {}
+        for op in ops:
+            latest[op["sheet_row"]] = op["payload"]
+        ws.batch_update([
+            {"range": row_range(row, len(values)), "values": [values]}
+            for row, values in latest.items()
+        ])
+
+    elif batch["op"] == "delete":
+        for op in ops:
+            ws.delete_rows(op["sheet_row"])
+
+
+def flush(spreadsheet, ops, ack, renew=None):
+    """
+    Apply coalesced batches and ack each one as it lands. A failing
+    worksheet is skipped for the rest of this flush so its order is kept;
+    other worksheets still go through. `renew` is called before every
+    batch; when it returns False (the caller lost its lease) the flush
+    stops, leaving the rest for whoever holds the lease now.
+    """
+    failed = set()
+    applied = 0
+    errors = []
+
+    for batch in coalesce(ops):
+        if batch["worksheet"] in failed:
+            continue
+        if renew and not renew():
+            break
+        try:
+            apply_batch(spreadsheet, batch)
+        except Exception as e:
+            failed.add(batch["worksheet"])
+            errors.append(e)
+            continue
+        ack([op["id"] for op in batch["ops"]])
+        applied += len(batch["ops"])
+
+    if errors:
+        raise errors[0]
+    return applied